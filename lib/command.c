@@ -408,8 +408,10 @@ void install_element(enum node_type ntype, struct cmd_element *cmd)
 		cmd_token_new(START_TKN, CMD_ATTR_NORMAL, NULL, NULL);
 	graph_new_node(graph, token, (void (*)(void *)) & cmd_token_del);
 
-	cmd_graph_parse(graph, cmd);
-	cmd_graph_names(graph);
+	if (!cmd_graph_prebuilt(graph, cmd)) {
+		cmd_graph_parse(graph, cmd);
+		cmd_graph_names(graph);
+	}
 	cmd_graph_merge(cnode->cmdgraph, graph, +1);
 	graph_delete_graph(graph);
 
@@ -457,8 +459,10 @@ void uninstall_element(enum node_type ntype, struct cmd_element *cmd)
 		cmd_token_new(START_TKN, CMD_ATTR_NORMAL, NULL, NULL);
 	graph_new_node(graph, token, (void (*)(void *)) & cmd_token_del);
 
-	cmd_graph_parse(graph, cmd);
-	cmd_graph_names(graph);
+	if (!cmd_graph_prebuilt(graph, cmd)) {
+		cmd_graph_parse(graph, cmd);
+		cmd_graph_names(graph);
+	}
 	cmd_graph_merge(cnode->cmdgraph, graph, -1);
 	graph_delete_graph(graph);
 
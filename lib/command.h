@@ -224,15 +224,28 @@ struct cmd_node {
 			    int argc __attribute__((unused)),                  \
 			    struct cmd_token *argv[] __attribute__((unused)))
 
+/* DEFPY elements additionally reference the precompiled command graph
+ * that clidef.py emits into the _clippy.c file */
+#define DEFPY_CMD_ELEMENT(funcname, cmdname, cmdstr, helpstr, attrs)          \
+	static struct cmd_element cmdname = {                                  \
+		.string = cmdstr,                                              \
+		.func = funcname,                                              \
+		.doc = helpstr,                                                \
+		.attr = attrs,                                                 \
+		.daemon = 0,                                                   \
+		.name = #cmdname,                                              \
+		.prebuilt = &funcname##_cmdgraph,                              \
+	};
+
 #define DEFPY(funcname, cmdname, cmdstr, helpstr)                              \
-	DEFUN_CMD_ELEMENT(funcname, cmdname, cmdstr, helpstr, 0, 0)            \
+	DEFPY_CMD_ELEMENT(funcname, cmdname, cmdstr, helpstr, 0)               \
 	funcdecl_##funcname
 
 #define DEFPY_NOSH(funcname, cmdname, cmdstr, helpstr)                         \
 	DEFPY(funcname, cmdname, cmdstr, helpstr)
 
 #define DEFPY_ATTR(funcname, cmdname, cmdstr, helpstr, attr)                   \
-	DEFUN_CMD_ELEMENT(funcname, cmdname, cmdstr, helpstr, attr, 0)         \
+	DEFPY_CMD_ELEMENT(funcname, cmdname, cmdstr, helpstr, attr)            \
 	funcdecl_##funcname
 
 #define DEFPY_HIDDEN(funcname, cmdname, cmdstr, helpstr)                       \
@@ -458,6 +458,90 @@ void cmd_graph_names(struct graph *graph)
 	cmd_node_names(start, NULL, NULL);
 }
 
+/* Build the graph for a command from its precompiled form instead of
+ * running cmd_graph_parse() + cmd_graph_names().  graph must contain only
+ * the START_TKN node, as for cmd_graph_parse().
+ *
+ * Returns false (and leaves graph untouched) if there is no precompiled
+ * graph or it doesn't match the command's definition string.
+ */
+bool cmd_graph_prebuilt(struct graph *graph, struct cmd_element *cmd)
+{
+	const struct cmd_prebuilt *pb = cmd->prebuilt;
+	struct graph_node **nodes, *elem = NULL;
+	char *docbuf = NULL, *docpos, **docs = NULL;
+	size_t i, j, ndocs = 0;
+
+	if (!pb || pb->n_nodes < 2 || strcmp(pb->string, cmd->string))
+		return false;
+	if (vector_active(graph->nodes) != 1)
+		return false;
+
+	/* split helpstring into lines, same as doc_next() would see them */
+	if (cmd->doc) {
+		docbuf = XSTRDUP(MTYPE_TMP, cmd->doc);
+		for (docpos = docbuf; *docpos; docpos++)
+			if (*docpos == '\n')
+				ndocs++;
+		docs = XCALLOC(MTYPE_TMP, (ndocs + 1) * sizeof(docs[0]));
+		docpos = docbuf;
+		for (i = 0; i <= ndocs; i++)
+			docs[i] = strsep(&docpos, "\n");
+		ndocs++;
+	}
+
+	nodes = XCALLOC(MTYPE_TMP, pb->n_nodes * sizeof(nodes[0]));
+	nodes[0] = vector_slot(graph->nodes, 0);
+
+	for (i = 1; i < pb->n_nodes; i++) {
+		const struct cmd_prebuilt_node *pn = &pb->nodes[i];
+		struct cmd_token *tok;
+		const char *desc;
+
+		if (pn->doc == -1)
+			desc = NULL;
+		else if (pn->doc >= 0 && (size_t)pn->doc < ndocs)
+			desc = docs[pn->doc];
+		else
+			desc = "";
+
+		tok = cmd_token_new(pn->type, cmd->attr, pn->text, desc);
+		tok->allowrepeat = pn->allowrepeat;
+		tok->min = pn->min;
+		tok->max = pn->max;
+		if (pn->varname)
+			tok->varname = XSTRDUP(MTYPE_CMD_VAR, pn->varname);
+
+		nodes[i] = graph_new_node(graph, tok,
+					  (void (*)(void *)) & cmd_token_del);
+		if (pn->type == END_TKN)
+			elem = graph_new_node(graph, cmd, NULL);
+	}
+
+	for (i = 0; i < pb->n_nodes; i++) {
+		const struct cmd_prebuilt_node *pn = &pb->nodes[i];
+		struct cmd_token *tok = nodes[i]->data;
+
+		if (pn->forkjoin >= 0)
+			tok->forkjoin = nodes[pn->forkjoin];
+
+		for (j = 0; j < pn->n_to; j++)
+			vector_set(nodes[i]->to, nodes[pb->edges[pn->to + j]]);
+		for (j = 0; j < pn->n_from; j++)
+			vector_set(nodes[i]->from,
+				   nodes[pb->edges[pn->from + j]]);
+
+		/* * -> END_TKN -> cmd_element */
+		if (pn->type == END_TKN && elem)
+			graph_add_edge(nodes[i], elem);
+	}
+
+	XFREE(MTYPE_TMP, nodes);
+	XFREE(MTYPE_TMP, docs);
+	XFREE(MTYPE_TMP, docbuf);
+	return true;
+}
+
 #ifndef BUILDING_CLIPPY
 
 #include "command.h"
@@ -92,6 +92,37 @@ struct cmd_token {
 	struct graph_node *forkjoin; // paired FORK/JOIN for JOIN/FORK
 };
 
+/* Precompiled command graph, generated at build time by python/clidef.py
+ * for DEFPY commands so the definition string doesn't need to be parsed
+ * at startup.  Nodes are in the same order the parser would create them;
+ * the final cmd_element node following END_TKN is not included.
+ */
+struct cmd_prebuilt_node {
+	enum cmd_token_type type;
+	bool allowrepeat;
+	const char *text;
+	const char *varname;
+	long long min, max;
+
+	/* line number in the command's helpstring; -1 for NULL, -2 for "" */
+	int doc;
+	/* paired FORK/JOIN node index, -1 if none */
+	int forkjoin;
+
+	/* offsets into cmd_prebuilt->edges */
+	unsigned short to, n_to;
+	unsigned short from, n_from;
+};
+
+struct cmd_prebuilt {
+	/* definition this was generated from, to catch stale data */
+	const char *string;
+
+	size_t n_nodes;
+	const struct cmd_prebuilt_node *nodes;
+	const unsigned short *edges;
+};
+
 /* Structure of command element. */
 struct cmd_element {
 	const char *string; /* Command specification by string. */
@@ -104,6 +135,9 @@ struct cmd_element {
 		    struct cmd_token *[]);
 
 	const char *name; /* symbol name for debugging */
+
+	/* precompiled graph for DEFPY, NULL otherwise */
+	const struct cmd_prebuilt *prebuilt;
 };
 
 /* text for <cr> command */
@@ -117,6 +151,7 @@ extern void cmd_token_del(struct cmd_token *);
 extern void cmd_token_varname_set(struct cmd_token *token, const char *varname);
 
 extern void cmd_graph_parse(struct graph *graph, struct cmd_element *cmd);
+extern bool cmd_graph_prebuilt(struct graph *graph, struct cmd_element *cmd);
 extern void cmd_graph_names(struct graph *graph);
 extern void cmd_graph_merge(struct graph *old, struct graph *n,
 			    int direction);
@@ -92,7 +92,8 @@ static PyMemberDef members_graph_node[] = {
 	member(deprecated, T_BOOL),  member(hidden, T_BOOL),
 	member(text, T_STRING),      member(desc, T_STRING),
 	member(min, T_LONGLONG),     member(max, T_LONGLONG),
-	member(varname, T_STRING),   {},
+	member(varname, T_STRING),   member(idx, T_PYSSIZET),
+	{},
 };
 #undef member
 
@@ -116,6 +117,22 @@ static PyObject *graph_node_next(PyObject *self, PyObject *args)
 	return pylist;
 };
 
+/*
+ * node.prev() -- returns list of all "previous" nodes, in graph order.
+ */
+static PyObject *graph_node_prev(PyObject *self, PyObject *args)
+{
+	struct wrap_graph_node *wrap = (struct wrap_graph_node *)self;
+	PyObject *pylist;
+
+	pylist = PyList_New(vector_active(wrap->node->from));
+	for (size_t i = 0; i < vector_active(wrap->node->from); i++) {
+		struct graph_node *gn = vector_slot(wrap->node->from, i);
+		PyList_SetItem(pylist, i, graph_to_pyobj(wrap->wgraph, gn));
+	}
+	return pylist;
+};
+
 /*
  * node.join() -- return FORK's JOIN node or None
  */
@@ -136,6 +153,7 @@ static PyObject *graph_node_join(PyObject *self, PyObject *args)
 
 static PyMethodDef methods_graph_node[] = {
 	{"next", graph_node_next, METH_NOARGS, "outbound graph edge list"},
+	{"prev", graph_node_prev, METH_NOARGS, "inbound graph edge list"},
 	{"join", graph_node_join, METH_NOARGS, "outbound join node"},
 	{}};
 
@@ -157,6 +175,29 @@ static PyTypeObject typeobj_graph_node = {
 	.tp_methods = methods_graph_node,
 };
 
+static const char *token_type_name(enum cmd_token_type type)
+{
+	switch (type) {
+#define item(x) case x: return #x;
+		item(WORD_TKN)		      // words
+			item(VARIABLE_TKN)    // almost anything
+			item(RANGE_TKN)       // integer range
+			item(IPV4_TKN)	// IPV4 addresses
+			item(IPV4_PREFIX_TKN) // IPV4 network prefixes
+			item(IPV6_TKN)	// IPV6 prefixes
+			item(IPV6_PREFIX_TKN) // IPV6 network prefixes
+			item(MAC_TKN)	 // MAC address
+			item(MAC_PREFIX_TKN)  // MAC address with mask
+
+			/* plumbing types */
+			item(FORK_TKN) item(JOIN_TKN) item(START_TKN)
+				item(END_TKN)
+#undef item
+	default:
+		return "???";
+	}
+}
+
 static PyObject *graph_to_pyobj(struct wrap_graph *wgraph,
 				struct graph_node *gn)
 {
@@ -188,25 +229,20 @@ static PyObject *graph_to_pyobj(struct wrap_graph *wgraph,
 	wrap->node = gn;
 	wrap->type = "NULL";
 	wrap->allowrepeat = false;
+
+	/* the node after END_TKN holds the cmd_element, not a token */
+	if (gn->data && vector_active(gn->from) == 1) {
+		struct graph_node *prev = vector_slot(gn->from, 0);
+		struct cmd_token *ptok = prev->data;
+
+		if (ptok && ptok->type == END_TKN)
+			return (PyObject *)wrap;
+	}
+
 	if (gn->data) {
 		struct cmd_token *tok = gn->data;
-		switch (tok->type) {
-#define item(x) case x: wrap->type = #x; break;
-			item(WORD_TKN)		      // words
-				item(VARIABLE_TKN)    // almost anything
-				item(RANGE_TKN)       // integer range
-				item(IPV4_TKN)	// IPV4 addresses
-				item(IPV4_PREFIX_TKN) // IPV4 network prefixes
-				item(IPV6_TKN)	// IPV6 prefixes
-				item(IPV6_PREFIX_TKN) // IPV6 network prefixes
-				item(MAC_TKN)	 // MAC address
-				item(MAC_PREFIX_TKN)  // MAC address with mask
-
-				/* plumbing types */
-				item(FORK_TKN) item(JOIN_TKN) item(START_TKN)
-					item(END_TKN) default
-				: wrap->type = "???";
-		}
+
+		wrap->type = token_type_name(tok->type);
 
 		wrap->deprecated = (tok->attr == CMD_ATTR_DEPRECATED);
 		wrap->hidden = (tok->attr == CMD_ATTR_HIDDEN);
@@ -240,8 +276,278 @@ static PyObject *graph_first(PyObject *self, PyObject *args)
 	return graph_to_pyobj(gwrap, gn);
 };
 
+/*
+ * graph.tokens() -- flat list of all tokens, walked entirely in C
+ *
+ * order and depth are the same as clippy.graph_iterate() produces, but no
+ * GraphNode wrappers are created.  Edges are given as node indices
+ * ("idx"), the cmd_element node behind END_TKN is not included.
+ */
+static PyStructSequence_Field fields_graph_token[] = {
+	{(char *)"type", (char *)"token type name"},
+	{(char *)"text", (char *)"token text"},
+	{(char *)"desc", (char *)"help string"},
+	{(char *)"varname", (char *)"variable name"},
+	{(char *)"min", (char *)"RANGE_TKN minimum"},
+	{(char *)"max", (char *)"RANGE_TKN maximum"},
+	{(char *)"allowrepeat", (char *)"token can repeat"},
+	{(char *)"depth", (char *)"nesting depth"},
+	{(char *)"idx", (char *)"node index in graph"},
+	{(char *)"join", (char *)"FORK_TKN's JOIN_TKN idx, or None"},
+	{(char *)"next", (char *)"tuple of outbound edge idx"},
+	{(char *)"prev", (char *)"tuple of inbound edge idx"},
+	{},
+};
+
+static PyStructSequence_Desc desc_graph_token = {
+	.name = (char *)"_clippy.GraphToken",
+	.doc = (char *)"command graph token",
+	.fields = fields_graph_token,
+	.n_in_sequence = 12,
+};
+
+static PyTypeObject typeobj_graph_token;
+
+#if PY_MAJOR_VERSION >= 3
+#define pystr(s) PyUnicode_FromString(s)
+#define pyint(i) PyLong_FromSsize_t(i)
+#else
+#define pystr(s) PyString_FromString(s)
+#define pyint(i) PyInt_FromSsize_t(i)
+#endif
+
+struct node_idx {
+	struct graph_node *node;
+	Py_ssize_t idx;
+};
+
+static int node_idx_cmp(const void *a, const void *b)
+{
+	const struct node_idx *na = a, *nb = b;
+
+	if (na->node == nb->node)
+		return 0;
+	return (uintptr_t)na->node < (uintptr_t)nb->node ? -1 : 1;
+}
+
+static Py_ssize_t node_idx_find(struct node_idx *map, size_t n,
+				struct graph_node *gn)
+{
+	struct node_idx ref = {.node = gn}, *res;
+
+	res = bsearch(&ref, map, n, sizeof(map[0]), node_idx_cmp);
+	return res ? res->idx : -1;
+}
+
+static PyObject *edges_to_tuple(struct node_idx *map, size_t n, vector v,
+				bool skip)
+{
+	PyObject *tuple;
+	size_t i;
+
+	tuple = PyTuple_New(skip ? 0 : vector_active(v));
+	if (!tuple || skip)
+		return tuple;
+	for (i = 0; i < vector_active(v); i++)
+		PyTuple_SET_ITEM(tuple, i,
+				 pyint(node_idx_find(map, n, vector_slot(v, i))));
+	return tuple;
+}
+
+static PyObject *token_to_pyobj(struct node_idx *map, size_t n,
+				struct graph_node *gn, long depth)
+{
+	struct cmd_token *tok = gn->data;
+	PyObject *item;
+	int i = 0;
+
+	item = PyStructSequence_New(&typeobj_graph_token);
+	if (!item)
+		return NULL;
+
+#define set(val) PyStructSequence_SET_ITEM(item, i++, val)
+#define optstr(s) ((s) ? pystr(s) : (Py_INCREF(Py_None), Py_None))
+	set(pystr(token_type_name(tok->type)));
+	set(optstr(tok->text));
+	set(optstr(tok->desc));
+	set(optstr(tok->varname));
+	set(PyLong_FromLongLong(tok->min));
+	set(PyLong_FromLongLong(tok->max));
+	set(PyBool_FromLong(tok->allowrepeat));
+	set(pyint(depth));
+	set(pyint(node_idx_find(map, n, gn)));
+	if (tok->type == FORK_TKN && tok->forkjoin)
+		set(pyint(node_idx_find(map, n, tok->forkjoin)));
+	else
+		set(optstr(NULL));
+	set(edges_to_tuple(map, n, gn->to, tok->type == END_TKN));
+	set(edges_to_tuple(map, n, gn->from, false));
+#undef optstr
+#undef set
+
+	if (PyErr_Occurred()) {
+		Py_DECREF(item);
+		return NULL;
+	}
+	return item;
+}
+
+/* work item;  the "stop" nodes are an (offset, count) range in a shared
+ * pool since they need to be copied when entering a FORK/JOIN pair.
+ */
+struct walk_item {
+	struct graph_node *node;
+	size_t stop, nstop;
+	long depth;
+};
+
+static bool walk_stop(struct graph_node **pool, struct walk_item *it,
+		      struct graph_node *gn)
+{
+	for (size_t i = 0; i < it->nstop; i++)
+		if (pool[it->stop + i] == gn)
+			return true;
+	return false;
+}
+
+/* growable walk state: the stack of work items and the pool of stop nodes */
+struct walk {
+	struct walk_item *stack;
+	size_t n_stack, sz_stack;
+	struct graph_node **pool;
+	size_t n_pool, sz_pool;
+};
+
+static bool walk_push(struct walk *w, struct graph_node *gn, size_t stop,
+		      size_t nstop, long depth)
+{
+	if (w->n_stack == w->sz_stack) {
+		size_t sz = w->sz_stack * 2;
+		struct walk_item *stack;
+
+		stack = realloc(w->stack, sz * sizeof(stack[0]));
+		if (!stack)
+			return false;
+		w->stack = stack;
+		w->sz_stack = sz;
+	}
+	w->stack[w->n_stack++] = (struct walk_item){
+		.node = gn, .stop = stop, .nstop = nstop, .depth = depth};
+	return true;
+}
+
+static bool walk_pool_reserve(struct walk *w, size_t cnt)
+{
+	struct graph_node **pool;
+	size_t sz = w->sz_pool;
+
+	if (w->n_pool + cnt <= sz)
+		return true;
+	while (w->n_pool + cnt > sz)
+		sz *= 2;
+
+	pool = realloc(w->pool, sz * sizeof(pool[0]));
+	if (!pool)
+		return false;
+	w->pool = pool;
+	w->sz_pool = sz;
+	return true;
+}
+
+static PyObject *graph_tokens(PyObject *self, PyObject *args)
+{
+	struct wrap_graph *gwrap = (struct wrap_graph *)self;
+	struct graph *graph = gwrap->graph;
+	size_t n_nodes = vector_active(graph->nodes), i;
+	struct node_idx *map;
+	struct walk w = {.sz_stack = 16, .sz_pool = 16};
+	struct walk_item it;
+	PyObject *pylist, *item;
+
+	map = calloc(n_nodes, sizeof(map[0]));
+	w.stack = malloc(w.sz_stack * sizeof(w.stack[0]));
+	w.pool = malloc(w.sz_pool * sizeof(w.pool[0]));
+	if (!map || !w.stack || !w.pool) {
+		pylist = PyErr_NoMemory();
+		goto out;
+	}
+	pylist = PyList_New(0);
+	if (!pylist)
+		goto out;
+
+	for (i = 0; i < n_nodes; i++) {
+		map[i].node = vector_slot(graph->nodes, i);
+		map[i].idx = i;
+	}
+	qsort(map, n_nodes, sizeof(map[0]), node_idx_cmp);
+
+	walk_push(&w, vector_slot(graph->nodes, 0), 0, 0, 0);
+
+	while (w.n_stack > 0) {
+		struct cmd_token *tok;
+		size_t stop, nstop;
+
+		it = w.stack[--w.n_stack];
+		tok = it.node->data;
+
+		item = token_to_pyobj(map, n_nodes, it.node, it.depth);
+		if (!item || PyList_Append(pylist, item)) {
+			Py_XDECREF(item);
+			Py_CLEAR(pylist);
+			break;
+		}
+		Py_DECREF(item);
+
+		if (tok->type == END_TKN)
+			continue;
+
+		stop = it.stop;
+		nstop = it.nstop;
+
+		if (tok->type == FORK_TKN && tok->forkjoin) {
+			/* JOIN continues with the outer stop set + this FORK,
+			 * everything inside the FORK stops at the JOIN
+			 */
+			if (!walk_pool_reserve(&w, it.nstop + 2)
+			    || !walk_push(&w, tok->forkjoin, w.n_pool,
+					  it.nstop + 1, it.depth))
+				goto nomem;
+			memcpy(w.pool + w.n_pool, w.pool + it.stop,
+			       it.nstop * sizeof(w.pool[0]));
+			w.pool[w.n_pool + it.nstop] = it.node;
+			w.n_pool += it.nstop + 1;
+
+			w.pool[w.n_pool] = tok->forkjoin;
+			stop = w.n_pool++;
+			nstop = 1;
+		}
+
+		it.stop = stop;
+		it.nstop = nstop;
+		for (i = vector_active(it.node->to); i > 0; i--) {
+			struct graph_node *gn = vector_slot(it.node->to, i - 1);
+
+			if (gn == it.node || walk_stop(w.pool, &it, gn))
+				continue;
+			if (!walk_push(&w, gn, stop, nstop, it.depth + 1))
+				goto nomem;
+		}
+	}
+	goto out;
+
+nomem:
+	Py_CLEAR(pylist);
+	PyErr_NoMemory();
+out:
+	free(w.pool);
+	free(w.stack);
+	free(map);
+	return pylist;
+}
+
 static PyMethodDef methods_graph[] = {
 	{"first", graph_first, METH_NOARGS, "first graph node"},
+	{"tokens", graph_tokens, METH_NOARGS, "flat list of graph tokens"},
 	{}};
 
 static PyObject *graph_parse(PyTypeObject *type, PyObject *args,
@@ -329,6 +635,9 @@ PyMODINIT_FUNC command_py_init(void)
 		initret(NULL);
 	if (PyType_Ready(&typeobj_graph) < 0)
 		initret(NULL);
+	if (!typeobj_graph_token.tp_name)
+		PyStructSequence_InitType(&typeobj_graph_token,
+					  &desc_graph_token);
 
 	pymod = modcreate();
 	if (!pymod)
@@ -338,5 +647,7 @@ PyMODINIT_FUNC command_py_init(void)
 	PyModule_AddObject(pymod, "GraphNode", (PyObject *)&typeobj_graph_node);
 	Py_INCREF(&typeobj_graph);
 	PyModule_AddObject(pymod, "Graph", (PyObject *)&typeobj_graph);
+	Py_INCREF(&typeobj_graph_token);
+	PyModule_AddObject(pymod, "GraphToken", (PyObject *)&typeobj_graph_token);
 	initret(pymod);
 }
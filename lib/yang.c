@@ -27,6 +27,10 @@
 
 #include <libyang/user_types.h>
 
+#ifdef HAVE_ZLIB
+#include <zlib.h>
+#endif
+
 DEFINE_MTYPE(LIB, YANG_MODULE, "YANG module")
 DEFINE_MTYPE(LIB, YANG_DATA, "YANG data structure")
 
@@ -42,6 +46,33 @@ void yang_module_embed(struct yang_module_embed *embed)
 	embedupd = &embed->next;
 }
 
+static void yang_module_embed_free(void *model_data, void *user_data)
+{
+	XFREE(MTYPE_YANG_MODULE, model_data);
+}
+
+/* inflate a compressed module;  the result is handed to libyang and freed
+ * through yang_module_embed_free() once it has been parsed.
+ */
+static char *yang_module_embed_inflate(struct yang_module_embed *e)
+{
+#ifdef HAVE_ZLIB
+	uLongf len = e->data_len;
+	char *buf;
+
+	buf = XMALLOC(MTYPE_YANG_MODULE, e->data_len);
+	if (uncompress((Bytef *)buf, &len, e->data_z, e->data_z_len) != Z_OK
+	    || len != e->data_len - 1) {
+		XFREE(MTYPE_YANG_MODULE, buf);
+		return NULL;
+	}
+	buf[len] = '\0';
+	return buf;
+#else
+	return NULL;
+#endif
+}
+
 static const char *yang_module_imp_clb(const char *mod_name,
 				       const char *mod_rev,
 				       const char *submod_name,
@@ -62,6 +93,20 @@ static const char *yang_module_imp_clb(const char *mod_name,
 		if (mod_rev && strcmp(e->mod_rev, mod_rev))
 			continue;
 
+		if (!e->data && e->data_z) {
+			char *data = yang_module_embed_inflate(e);
+
+			if (!data) {
+				flog_warn(EC_LIB_YANG_MODULE_LOAD,
+					  "YANG model \"%s@%s\" could not be decompressed",
+					  e->mod_name, e->mod_rev);
+				break;
+			}
+			*format = e->format;
+			*free_module_data = yang_module_embed_free;
+			return data;
+		}
+
 		*format = e->format;
 		return e->data;
 	}
@@ -51,7 +51,15 @@ DECLARE_MTYPE(YANG_DATA)
 struct yang_module_embed {
 	struct yang_module_embed *next;
 	const char *mod_name, *mod_rev;
+
 	const char *data;
+	/* with --enable-yang-compress, data is NULL and the module text is
+	 * zlib-compressed here;  it is inflated only when libyang loads it.
+	 * data_len includes the terminating NUL.
+	 */
+	const unsigned char *data_z;
+	size_t data_z_len, data_len;
+
 	LYS_INFORMAT format;
 };
 
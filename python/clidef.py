@@ -16,7 +16,7 @@
 # with this program; see the file COPYING; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 
-import clippy, traceback, sys, os
+import clippy, traceback, sys, os, hashlib, json
 from collections import OrderedDict
 from functools import reduce
 from pprint import pprint
@@ -137,6 +137,7 @@ handlers = {
 # common form, without requiring a more advanced template engine (e.g.
 # jinja2)
 templ = Template('''/* $fnname => "$cmddef" */
+$cmdgraph
 DEFUN_CMD_FUNC_DECL($fnname)
 #define funcdecl_$fnname static int ${fnname}_magic(\\
 	const struct cmd_element *self __attribute__ ((unused)),\\
@@ -177,80 +178,330 @@ $argblocks
 ''')
 
 # invoked for each named parameter
-argblock = Template('''
-		if (!strcmp(argv[_i]->varname, \"$varname\")) {$strblock
-			$code
-		}''')
+argblock = Template('''$strblock$code''')
 
-def process_file(fn, ofd, dumpfd, all_defun):
+def cchar(char):
+    if char == '':
+        return "'\\0'"
+    if char in '\'\\':
+        return "'\\%s'" % (char)
+    return "'%s'" % (char)
+
+def dispatch(blocks, indent = 2):
+    '''build a switch() tree that picks the right block for argv[_i]
+
+    blocks maps varname => C code.  Instead of strcmp()ing each varname in
+    turn, a decision tree on individual characters of argv[_i]->varname is
+    built at generation time.  Only positions up to the length of the
+    shortest remaining candidate are looked at, so nothing is read past the
+    terminating NUL.  Each leaf still does one strcmp() of the full name:
+    other commands using the same function (e.g. an ALIAS) can have other
+    varnames, which must be ignored rather than picked up by whichever
+    leaf they happen to reach.
+    '''
+
+    tabs = '\t' * indent
+    names = sorted(blocks.keys())
+    if len(names) == 1:
+        code = blocks[names[0]].replace('\n', '\n\t' + tabs)
+        return '%sif (!strcmp(argv[_i]->varname, "%s")) {\n%s\t%s\n%s}\n' % (
+            tabs, names[0], tabs, code, tabs)
+
+    # pick the position that splits the candidates into most groups
+    minlen = min([len(name) for name in names])
+    best = None
+    for i in range(0, minlen + 1):
+        groups = OrderedDict()
+        for name in names:
+            groups.setdefault(name[i:i + 1], OrderedDict())[name] = blocks[name]
+        if best is None or len(groups) > len(best[1]):
+            best = (i, groups)
+    i, groups = best
+
+    out = ['%sswitch (argv[_i]->varname[%d]) {\n' % (tabs, i)]
+    for char, sub in groups.items():
+        out.append('%scase %s: {\n' % (tabs, cchar(char)))
+        out.append(dispatch(sub, indent + 1))
+        out.append('%s\tbreak;\n%s}\n' % (tabs, tabs))
+    out.append('%s}\n' % (tabs))
+    return ''.join(out)
+
+# precompiled command graph, see struct cmd_prebuilt in lib/command_graph.h.
+# $fnname and $cmddef are filled in by process_file(), everything else only
+# depends on the command definition.
+graphtempl = Template('''static const unsigned short $${fnname}_cmdgraph_edges[] = {
+$edges
+};
+static const struct cmd_prebuilt_node $${fnname}_cmdgraph_nodes[] = {
+$nodes
+};
+static const struct cmd_prebuilt $${fnname}_cmdgraph = {
+	.string = "$${cmddef}",
+	.n_nodes = $n_nodes,
+	.nodes = $${fnname}_cmdgraph_nodes,
+	.edges = $${fnname}_cmdgraph_edges,
+};''')
+
+plumbing = ['START_TKN', 'END_TKN', 'FORK_TKN', 'JOIN_TKN']
+
+def cstr(text):
+    if text is None:
+        return 'NULL'
+    text = text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '"%s"' % (text.replace('$', '$$'))
+
+def graph_prebuilt(cmddef):
+    '''serialize the command graph for cmd_graph_prebuilt()
+
+    to know which token gets which line of the helpstring, the definition
+    is parsed a second time with a fake helpstring that has each line's
+    index as text.
+    '''
+
+    tokens = clippy.Graph(cmddef).tokens()
+    ndoc = len([token for token in tokens if token.type not in plumbing])
+    fakedoc = ''.join(['%d\n' % (i) for i in range(ndoc)])
+
+    # the cmd_element node isn't in the token list, which leaves a hole in
+    # the idx numbering;  pos maps idx to the position in the output
+    tokens = clippy.Graph(cmddef, fakedoc).tokens()
+    nodes = sorted(dict([(token.idx, token) for token in tokens]).values(),
+                   key = lambda token: token.idx)
+    if len(nodes) > 0xffff:
+        return None
+    pos = dict([(node.idx, i) for i, node in enumerate(nodes)])
+
+    forkjoin = {}
+    for node in nodes:
+        if node.join is not None:
+            forkjoin[pos[node.idx]] = pos[node.join]
+            forkjoin[pos[node.join]] = pos[node.idx]
+
+    edges = []
+    out = []
+    for node in nodes:
+        if node.desc is None:
+            doc = -1
+        elif node.desc == '':
+            doc = -2
+        else:
+            doc = int(node.desc)
+
+        nto = [pos[idx] for idx in node.next if idx in pos]
+        nfrom = [pos[idx] for idx in node.prev if idx in pos]
+        item = ['.type = %s' % (node.type)]
+        if node.allowrepeat:
+            item.append('.allowrepeat = true')
+        item.append('.text = %s' % (cstr(node.text)))
+        if node.varname is not None:
+            item.append('.varname = %s' % (cstr(node.varname)))
+        if node.type == 'RANGE_TKN':
+            item.append('.min = %dLL, .max = %dLL' % (node.min, node.max))
+        item.append('.doc = %d, .forkjoin = %d' % (
+            doc, forkjoin.get(pos[node.idx], -1)))
+        item.append('.to = %d, .n_to = %d' % (len(edges), len(nto)))
+        edges.extend(nto)
+        item.append('.from = %d, .n_from = %d' % (len(edges), len(nfrom)))
+        edges.extend(nfrom)
+        out.append('\t{ %s },' % (', '.join(item)))
+
+    if len(edges) > 0xffff:
+        return None
+
+    edgelines = []
+    for i in range(0, len(edges), 16):
+        edgelines.append('\t%s,' % (', '.join([str(e) for e in edges[i:i + 16]])))
+
+    return graphtempl.substitute({
+        'edges': '\n'.join(edgelines),
+        'nodes': '\n'.join(out),
+        'n_nodes': len(nodes),
+    })
+
+# fallback if the graph can't be serialized;  n_nodes = 0 makes
+# cmd_graph_prebuilt() fail and the definition string gets parsed instead
+graphempty = '''static const struct cmd_prebuilt ${fnname}_cmdgraph = {
+	.string = "${cmddef}",
+};'''
+
+def process_cmddef(cmddef):
+    '''generate the template parameters for one command definition
+
+    returns a (params, doc) tuple; params lacks "cmddef" and "fnname" so the
+    result only depends on cmddef and can be cached.
+    '''
+
+    graph = clippy.Graph(cmddef)
+    args = OrderedDict()
+    for token in graph.tokens():
+        if token.type not in handlers:
+            continue
+        if token.varname is None:
+            continue
+        arg = args.setdefault(token.varname, [])
+        arg.append(handlers[token.type](token))
+
+    #clippy.dump(graph)
+    #pprint(args)
+
+    params = {}
+    argdefs = []
+    argdecls = []
+    arglist = []
+    argblocks = OrderedDict()
+    doc = []
+    canfail = 0
+
+    def do_add(handler, varname, attr = ''):
+        argdefs.append(',\\\n\t%s %s%s' % (handler.argtype, varname, attr))
+        argdecls.append('\t%s\n' % (handler.decl.substitute({'varname': varname}).replace('\n', '\n\t')))
+        arglist.append(', %s%s' % (handler.deref, varname))
+        if attr == '':
+            at = handler.argtype
+            if not at.startswith('const '):
+                at = '. . . ' + at
+            doc.append('\t%-26s %s' % (at, varname))
+
+    for varname in args.keys():
+        handler = mix_handlers(args[varname])
+        #print(varname, handler)
+        if handler is None: continue
+        do_add(handler, varname)
+        code = handler.code.substitute({'varname': varname})
+        if handler.canfail:
+            canfail = 1
+        strblock = ''
+        if not handler.drop_str:
+            do_add(StringHandler(None), '%s_str' % (varname), ' __attribute__ ((unused))')
+            strblock = '%s_str = argv[_i]->arg;\n' % (varname)
+        argblocks[varname] = argblock.substitute({'varname': varname, 'strblock': strblock, 'code': code})
+
+    params['argdefs'] = ''.join(argdefs)
+    params['argdecls'] = ''.join(argdecls)
+    params['arglist'] = ''.join(arglist)
+    params['argblocks'] = dispatch(argblocks).rstrip('\n') if argblocks else ''
+    params['canfail'] = canfail
+    params['nonempty'] = len(argblocks)
+    params['cmdgraph'] = graph_prebuilt(cmddef) or graphempty
+    return params, doc
+
+class GenCache(object):
+    '''persistent cache of process_cmddef() results
+
+    entries are stored one per file, named by a hash over the command
+    definition and the clidef.py and clippy binaries (which covers the
+    handler table, the templates and the command parser.)  Any problem
+    reading an entry is treated as a cache miss.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+        version = hashlib.sha256()
+        for fn in [os.path.realpath(__file__), sys.executable]:
+            try:
+                with open(fn, 'rb') as fd:
+                    version.update(fd.read())
+            except (IOError, OSError, TypeError):
+                version.update(str(fn).encode('utf-8'))
+        self.version = version.hexdigest()
+
+    def filename(self, cmddef):
+        key = hashlib.sha256(('%s\0%s' % (self.version, cmddef)).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, key[:2], key + '.json')
+
+    def get(self, cmddef):
+        try:
+            with open(self.filename(cmddef), 'r') as fd:
+                data = json.load(fd)
+            if data['cmddef'] != cmddef:
+                return None
+            return data['params'], data['doc']
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def put(self, cmddef, params, doc):
+        filename = self.filename(cmddef)
+        newname = '%s.new-%d' % (filename, os.getpid())
+        try:
+            if not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            with open(newname, 'w') as fd:
+                json.dump({'cmddef': cmddef, 'params': params, 'doc': doc}, fd)
+            os.rename(newname, filename)
+        except (IOError, OSError):
+            # concurrent makedirs or a read-only cache;  not fatal
+            pass
+
+def process_file(fn, ofd, dumpfd, all_defun, cache = None):
     filedata = clippy.parse(fn)
 
     for entry in filedata['data']:
+        if entry['type'].startswith('DEFUNSH'):
+            continue
         if entry['type'].startswith('DEFPY') or (all_defun and entry['type'].startswith('DEFUN')):
             cmddef = entry['args'][2]
             cmddef = ''.join([i[1:-1] for i in cmddef])
 
-            graph = clippy.Graph(cmddef)
-            args = OrderedDict()
-            for token, depth in clippy.graph_iterate(graph):
-                if token.type not in handlers:
-                    continue
-                if token.varname is None:
-                    continue
-                arg = args.setdefault(token.varname, [])
-                arg.append(handlers[token.type](token))
+            cached = cache.get(cmddef) if cache is not None else None
+            if cached is not None:
+                params, doc = cached
+            else:
+                params, doc = process_cmddef(cmddef)
+                if cache is not None:
+                    cache.put(cmddef, params, doc)
 
             #print('-' * 76)
             #pprint(entry)
-            #clippy.dump(graph)
-            #pprint(args)
-
-            params = { 'cmddef': cmddef, 'fnname': entry['args'][0][0] }
-            argdefs = []
-            argdecls = []
-            arglist = []
-            argblocks = []
-            doc = []
-            canfail = 0
-
-            def do_add(handler, varname, attr = ''):
-                argdefs.append(',\\\n\t%s %s%s' % (handler.argtype, varname, attr))
-                argdecls.append('\t%s\n' % (handler.decl.substitute({'varname': varname}).replace('\n', '\n\t')))
-                arglist.append(', %s%s' % (handler.deref, varname))
-                if attr == '':
-                    at = handler.argtype
-                    if not at.startswith('const '):
-                        at = '. . . ' + at
-                    doc.append('\t%-26s %s' % (at, varname))
-
-            for varname in args.keys():
-                handler = mix_handlers(args[varname])
-                #print(varname, handler)
-                if handler is None: continue
-                do_add(handler, varname)
-                code = handler.code.substitute({'varname': varname}).replace('\n', '\n\t\t\t')
-                if handler.canfail:
-                    canfail = 1
-                strblock = ''
-                if not handler.drop_str:
-                    do_add(StringHandler(None), '%s_str' % (varname), ' __attribute__ ((unused))')
-                    strblock = '\n\t\t\t%s_str = argv[_i]->arg;' % (varname)
-                argblocks.append(argblock.substitute({'varname': varname, 'strblock': strblock, 'code': code}))
 
             if dumpfd is not None:
-                if len(arglist) > 0:
+                if len(doc) > 0:
                     dumpfd.write('"%s":\n%s\n\n' % (cmddef, '\n'.join(doc)))
                 else:
                     dumpfd.write('"%s":\n\t---- no magic arguments ----\n\n' % (cmddef))
 
-            params['argdefs'] = ''.join(argdefs)
-            params['argdecls'] = ''.join(argdecls)
-            params['arglist'] = ''.join(arglist)
-            params['argblocks'] = ''.join(argblocks)
-            params['canfail'] = canfail
-            params['nonempty'] = len(argblocks)
+            params = dict(params)
+            params['cmddef'] = cmddef
+            params['fnname'] = entry['args'][0][0]
+            params['cmdgraph'] = Template(params['cmdgraph']).substitute(params)
             ofd.write(templ.substitute(params))
 
+def process_output(job):
+    '''process one (cfile, outfile) pair, used for -o / batch mode'''
+
+    cfile, outfile, show, all_defun, cachedir = job
+    ofd = StringIO()
+    dumpfd = StringIO() if show else None
+    cache = GenCache(cachedir) if cachedir else None
+
+    process_file(cfile, ofd, dumpfd, all_defun, cache)
+    clippy.wrdiff(outfile, ofd, [cfile, os.path.realpath(__file__), sys.executable])
+
+    if dumpfd is not None:
+        return dumpfd.getvalue()
+    return ''
+
+def process_batch(jobs, nproc):
+    '''process a list of jobs, optionally spread over a process pool'''
+
+    if nproc <= 1 or len(jobs) <= 1:
+        return [process_output(job) for job in jobs]
+
+    import multiprocessing
+    # _clippy is built into the clippy binary, so workers need to be forked
+    # off this interpreter rather than spawned as new ones
+    try:
+        mp = multiprocessing.get_context('fork')
+    except AttributeError:
+        mp = multiprocessing
+
+    pool = mp.Pool(min(nproc, len(jobs)))
+    try:
+        return pool.map(process_output, jobs, chunksize = 1)
+    finally:
+        pool.close()
+        pool.join()
+
 if __name__ == '__main__':
     import argparse
 
@@ -259,22 +510,29 @@ if __name__ == '__main__':
             help = 'process DEFUN() statements in addition to DEFPY()')
     argp.add_argument('--show', action = 'store_const', const = True,
             help = 'print out list of arguments and types for each definition')
-    argp.add_argument('-o', type = str, metavar = 'OUTFILE',
-            help = 'output C file name')
-    argp.add_argument('cfile', type = str)
+    argp.add_argument('-o', type = str, metavar = 'OUTFILE', action = 'append',
+            help = 'output C file name (once per input file in batch mode)')
+    argp.add_argument('-j', '--jobs', type = int, metavar = 'N', default = 1,
+            help = 'number of worker processes in batch mode')
+    argp.add_argument('--cache', type = str, metavar = 'DIR',
+            default = os.environ.get('CLIPPY_CACHE'),
+            help = 'cache generated code in DIR (default: $CLIPPY_CACHE)')
+    argp.add_argument('cfile', type = str, nargs = '+')
     args = argp.parse_args()
 
-    dumpfd = None
-    if args.o is not None:
-        ofd = StringIO()
-        if args.show:
-            dumpfd = sys.stdout
-    else:
-        ofd = sys.stdout
-        if args.show:
-            dumpfd = sys.stderr
+    if args.o is None:
+        if len(args.cfile) > 1:
+            argp.error('processing multiple files requires one -o per file')
+
+        dumpfd = sys.stderr if args.show else None
+        cache = GenCache(args.cache) if args.cache else None
+        process_file(args.cfile[0], sys.stdout, dumpfd, args.all_defun, cache)
+        sys.exit(0)
 
-    process_file(args.cfile, ofd, dumpfd, args.all_defun)
+    if len(args.o) != len(args.cfile):
+        argp.error('%d output files given for %d input files' % (len(args.o), len(args.cfile)))
 
-    if args.o is not None:
-        clippy.wrdiff(args.o, ofd, [args.cfile, os.path.realpath(__file__), sys.executable])
+    jobs = [(cfile, outfile, args.show, args.all_defun, args.cache)
+            for cfile, outfile in zip(args.cfile, args.o)]
+    for dump in process_batch(jobs, args.jobs):
+        sys.stdout.write(dump)
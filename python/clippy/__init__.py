@@ -18,35 +18,37 @@
 
 import os, stat
 import _clippy
-from _clippy import parse, Graph, GraphNode
+from _clippy import parse, Graph, GraphNode, GraphToken
 
 def graph_iterate(graph):
     '''iterator yielding all nodes of a graph
 
     nodes arrive in input/definition order, graph circles are avoided.
+    Graph.tokens() returns the same walk (as GraphToken tuples instead of
+    GraphNode objects) in one call and should be preferred.
     '''
 
-    queue = [(graph.first(), frozenset(), 0)]
-    while len(queue) > 0:
-        node, stop, depth = queue.pop(0)
+    stack = [(graph.first(), frozenset(), 0)]
+    while len(stack) > 0:
+        node, stop, depth = stack.pop()
         yield node, depth
 
         join = node.join()
         if join is not None:
-            queue.insert(0, (join, stop.union(frozenset([node])), depth))
+            stack.append((join, stop.union(frozenset([node])), depth))
             join = frozenset([join])
 
         stop = join or stop
         nnext = node.next()
         for n in reversed(nnext):
             if n not in stop and n is not node:
-                queue.insert(0, (n, stop, depth + 1))
+                stack.append((n, stop, depth + 1))
 
 def dump(graph):
     '''print out clippy.Graph'''
 
-    for i, depth in graph_iterate(graph):
-        print('\t%s%s %r' % ('  ' * (depth * 2), i.type, i.text))
+    for token in graph.tokens():
+        print('\t%s%s %r' % ('  ' * (token.depth * 2), token.type, token.text))
 
 def wrdiff(filename, buf, reffiles = []):
     '''write buffer to file if contents changed'''
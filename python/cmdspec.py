@@ -0,0 +1,192 @@
+# FRR CLI command specification dumper
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation; either version 2 of the License, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; see the file COPYING; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
+
+'''
+Extract all DEFUN/DEFPY/ALIAS/DEFUNSH command definitions from a set of C
+files and write them out, together with their parsed command graphs, as a
+JSON file.  This is consumed by tools/frr-reload.py to validate a config
+file before anything is applied to the running system.
+
+Output format:
+
+    {
+        "version": 1,
+        "commands": [
+            {
+                "cmd": "<command definition string>",
+                "nodes": ["CONFIG_NODE", ...],
+                "graph": [[type, text, min, max, [next, ...]], ...]
+            },
+            ...
+        ]
+    }
+
+graph[0] is the START_TKN node; "next" refers to indices into the same
+list.  min/max are only meaningful for RANGE_TKN.
+'''
+
+import clippy, sys, os, re, json
+from collections import OrderedDict
+from io import StringIO
+
+# position of the command name and string for the various DEFUN flavours;
+# vtysh's DEFUNSH variants have the daemon mask as an extra first argument.
+def cmdpos(etype):
+    if etype.startswith('DEFUNSH'):
+        return (2, 3)
+    return (1, 2)
+
+re_define = re.compile(r'^\s*define\s+([A-Za-z_][A-Za-z0-9_]*)\s+(.*)$', re.S)
+re_ctoken = re.compile(r'"(?:[^"\\]|\\.)*"|[A-Za-z_][A-Za-z0-9_]*|\S')
+
+# commands that can't be resolved or parsed are cut down to their longest
+# parseable prefix followed by this variadic wildcard;  validation gets more
+# lenient for them, but a valid config line is never rejected.
+wildcard = 'LINE...'
+unresolved = '\0'
+
+def collect_defines(filedata, defines):
+    '''gather "#define FOO "string"" macros usable in command strings'''
+
+    for entry in filedata['data']:
+        if entry['type'] != 'PREPROC':
+            continue
+        m = re_define.match(entry['line'].replace('\\\n', ' '))
+        if m is None:
+            continue
+        defines.setdefault(m.group(1), re_ctoken.findall(m.group(2)))
+
+class Unresolved(Exception):
+    '''raised with the text resolved so far when a macro is unknown'''
+    pass
+
+def resolve(tokens, defines, depth = 0):
+    '''turn a list of C tokens (string literals / macro names) into a string'''
+
+    out = []
+    for token in tokens:
+        if token.startswith('"'):
+            out.append(token[1:-1])
+        elif token in defines and depth < 8:
+            try:
+                out.append(resolve(defines[token], defines, depth + 1))
+            except Unresolved as e:
+                raise Unresolved(''.join(out) + e.args[0])
+        else:
+            raise Unresolved(''.join(out))
+    return ''.join(out)
+
+def fallback(text):
+    '''wildcard command graph for the beginning of a command string'''
+
+    words = text.split()
+    for i in range(len(words), -1, -1):
+        try:
+            return clippy.Graph(' '.join(words[:i] + [wildcard]))
+        except Exception:
+            pass
+
+def graph_serialize(graph):
+    '''flatten a clippy.Graph into a list of [type, text, min, max, next]'''
+
+    tokens = OrderedDict()
+    for token in graph.tokens():
+        tokens.setdefault(token.idx, token)
+    index = dict([(idx, i) for i, idx in enumerate(tokens.keys())])
+
+    out = []
+    for token in tokens.values():
+        nnext = [index[n] for n in token.next if n in index]
+        if token.type == 'RANGE_TKN':
+            out.append([token.type, token.text, token.min, token.max, nnext])
+        else:
+            out.append([token.type, token.text, 0, 0, nnext])
+    return out
+
+def process_files(fns, ofd):
+    defines = {}
+    parsed = []
+    for fn in fns:
+        filedata = clippy.parse(fn)
+        collect_defines(filedata, defines)
+        parsed.append(filedata)
+
+    commands = OrderedDict()
+    installs = {}
+    for filedata in parsed:
+        for entry in filedata['data']:
+            etype = entry['type']
+            if etype == 'install_element':
+                if len(entry['args']) < 2:
+                    continue
+                node = ''.join(entry['args'][0])
+                cmdname = entry['args'][1][-1]
+                installs.setdefault(cmdname, set()).add(node)
+            elif etype.startswith('DEFUN') or etype.startswith('DEFPY') \
+                    or etype.startswith('ALIAS'):
+                namepos, strpos = cmdpos(etype)
+                if len(entry['args']) <= strpos:
+                    continue
+                cmdname = entry['args'][namepos][-1]
+                try:
+                    cmddef = resolve(entry['args'][strpos], defines)
+                except Unresolved as e:
+                    # keep the known part, marked so it isn't parsed as is
+                    cmddef = e.args[0] + ' ' + unresolved
+                commands.setdefault(cmddef, set()).add(cmdname)
+
+    out = []
+    for cmddef, cmdnames in commands.items():
+        nodes = set()
+        for cmdname in cmdnames:
+            nodes.update(installs.get(cmdname, []))
+        try:
+            if cmddef.endswith(unresolved):
+                raise ValueError('unresolved macro')
+            graph = clippy.Graph(cmddef)
+        except Exception:
+            cmddef = cmddef.rstrip(unresolved).strip()
+            sys.stderr.write('cannot parse command "%s", using a wildcard\n'
+                    % (cmddef))
+            graph = fallback(cmddef)
+        out.append(OrderedDict([
+            ('cmd', cmddef),
+            ('nodes', sorted(nodes)),
+            ('graph', graph_serialize(graph)),
+        ]))
+
+    json.dump(OrderedDict([('version', 1), ('commands', out)]), ofd,
+            separators = (',', ':'))
+    ofd.write('\n')
+
+if __name__ == '__main__':
+    import argparse
+
+    argp = argparse.ArgumentParser(description = 'FRR CLI command spec dumper')
+    argp.add_argument('-o', type = str, metavar = 'OUTFILE',
+            help = 'output JSON file name')
+    argp.add_argument('cfiles', type = str, nargs = '+')
+    args = argp.parse_args()
+
+    if args.o is not None:
+        ofd = StringIO()
+    else:
+        ofd = sys.stdout
+
+    process_files(args.cfiles, ofd)
+
+    if args.o is not None:
+        clippy.wrdiff(args.o, ofd, args.cfiles + [os.path.realpath(__file__), sys.executable])
@@ -2,8 +2,9 @@
 Topotest conftest.py file.
 """
 
-from lib.topogen import get_topogen, diagnose_env
+from lib.topogen import get_topogen, diagnose_env, flush_topology
 from lib.topotest import json_cmp_result
+from lib import topotest
 from lib.topolog import logger
 import pytest
 
@@ -46,6 +47,32 @@ def pytest_configure(config):
     "Assert that the environment is correctly configured."
     if not diagnose_env():
         pytest.exit('enviroment has errors, please read the logs')
+    topotest.reset_convergence_file()
+
+def pytest_unconfigure(config):
+    "Stop the network kept for topology reuse, save the time accounting."
+    flush_topology()
+    report = topotest.timing_report()
+    if report['tests']:
+        topotest.write_timing_report(report)
+
+def pytest_runtest_logreport(report):
+    "Account the duration of each test phase for the time accounting report."
+    # pytest-xdist: the workers account their own tests
+    if getattr(report, 'node', None) is not None:
+        return
+    topotest.record_test_duration(report.nodeid, report.duration)
+
+def pytest_terminal_summary(terminalreporter):
+    "Show where the tests spent their time."
+    lines = topotest.timing_summary_lines()
+    if not lines:
+        return
+
+    terminalreporter.write_sep('=', 'topotest time accounting')
+    for line in lines:
+        terminalreporter.write_line(line)
+    terminalreporter.write_line('(details in {})'.format(topotest.timing_file()))
 
 def pytest_runtest_makereport(item, call):
     "Log all assert messages to default logger with error level"
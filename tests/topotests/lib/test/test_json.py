@@ -452,5 +452,65 @@ def test_json_list_start_failure():
     assert json_cmp(dcomplete, dsub4) is not None
 
 
+def test_json_list_large():
+    "Test JSON lists big enough to be matched using an index."
+
+    dcomplete = {
+        'routes': [
+            {
+                'prefix': '10.0.{}.0/24'.format(i),
+                'nexthop': '192.168.0.{}'.format(i % 4),
+                'metric': i,
+            } for i in range(200)
+        ],
+        'ids': list(range(200)),
+    }
+
+    dsub1 = {
+        'routes': [
+            {'prefix': '10.0.150.0/24', 'metric': 150},
+            {'nexthop': '192.168.0.3', 'metric': 7},
+            {'prefix': '10.0.20.0/24', 'protocol': None},
+        ],
+        'ids': [199, 0, 42],
+    }
+    dsub2 = {
+        'routes': [{'prefix': '10.0.150.0/24', 'metric': 151}],
+    }
+    dsub3 = {
+        'routes': [{'nexthop': '192.168.0.3', 'metric': 8}],
+    }
+    dsub4 = {
+        'ids': [0, 200],
+    }
+
+    assert json_cmp(dcomplete, dsub1) is None
+    assert json_cmp(dcomplete, dsub2) is not None
+    assert json_cmp(dcomplete, dsub3) is not None
+    assert json_cmp(dcomplete, dsub4) is not None
+
+
+def test_json_errors():
+    "Test that all errors are reported even if the comparison stopped early."
+
+    dcomplete = {
+        'i1': 'item1',
+        'i2': 'item2',
+    }
+
+    dsub1 = {
+        'i1': 'item2',
+        'i2': 'item1',
+        'i3': 'item3',
+    }
+
+    result = json_cmp(dcomplete, dsub1)
+    assert result is not None
+    errors = str(result)
+    assert 'expected key(s) [\'i3\']' in errors
+    assert 'json["i1"] value is different' in errors
+    assert 'json["i2"] value is different' in errors
+
+
 if __name__ == '__main__':
     sys.exit(pytest.main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+#
+# test_timing.py
+# Tests for library functions: timed() and timing_report().
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS DISCLAIM ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the time accounting functions.
+"""
+
+import os
+import sys
+import time
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, '../../'))
+
+# pylint: disable=C0413
+from lib import topotest
+
+@pytest.fixture
+def timing(monkeypatch):
+    "Start every test with empty time accounting."
+    monkeypatch.setattr(topotest, 'timing_tests', {})
+
+def test_timed_nested(timing, monkeypatch):
+    "Test that nested blocks are subtracted from the enclosing block"
+
+    # pytest sets the variable before the test call
+    monkeypatch.setenv('PYTEST_CURRENT_TEST', 'test_mod.py::test_one (call)')
+
+    with topotest.timed('poll', 'check'):
+        with topotest.timed('vtysh', 'show version'):
+            time.sleep(0.05)
+        with topotest.timed('poll-wait', 'check'):
+            time.sleep(0.1)
+    topotest.record_test_duration('test_mod.py::test_one', 0.2)
+
+    report = topotest.timing_report()
+    test = report['tests']['test_mod.py::test_one']
+    assert test['categories']['poll']['time'] >= 0.15
+    assert test['categories']['poll']['self'] < 0.05
+    assert test['categories']['vtysh']['count'] == 1
+    assert 0.1 <= test['sleep'] < 0.15
+    assert abs(test['work'] - (0.2 - test['sleep'])) < 0.002
+    assert [call['category'] for call in test['slowest']] == [
+        'poll', 'poll-wait', 'vtysh']
+
+def test_timing_modules(timing, monkeypatch):
+    "Test the per module summary"
+
+    monkeypatch.setenv('PYTEST_CURRENT_TEST', 'test_mod.py::test_one (call)')
+
+    with topotest.timed('sleep'):
+        pass
+    monkeypatch.setenv('PYTEST_CURRENT_TEST', 'test_mod.py::test_two (call)')
+    with topotest.timed('sleep'):
+        pass
+    topotest.record_test_duration('test_mod.py::test_one', 1.0)
+    topotest.record_test_duration('test_mod.py::test_two', 2.0)
+
+    report = topotest.timing_report()
+    assert len(report['tests']) == 2
+    assert report['modules']['test_mod.py']['duration'] == 3.0
+    assert report['modules']['test_mod.py']['categories']['sleep']['count'] == 2
+    assert report['total']['duration'] == 3.0
+    assert topotest.timing_summary_lines(report)[1].endswith('test_mod.py')
+
+if __name__ == '__main__':
+    sys.exit(pytest.main())
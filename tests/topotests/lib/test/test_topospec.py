@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+#
+# test_topospec.py
+# Tests for library functions: expand_spec() and router_vars().
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS DISCLAIM ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the declarative topology specifications.
+"""
+
+import os
+import sys
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, '../../'))
+
+# pylint: disable=C0413
+from lib.topospec import expand_spec, router_vars, render_config
+
+def test_generators():
+    "Test the routers and links of the topology generators"
+
+    spec = expand_spec({'generators': [
+        {'type': 'clos', 'spines': 2, 'leaves': 3},
+        {'type': 'ring', 'routers': 4},
+        {'type': 'mesh', 'routers': 4, 'name': 'm'},
+    ]})
+    assert list(spec['routers'].keys()) == [
+        'spine1', 'spine2', 'leaf1', 'leaf2', 'leaf3',
+        'r1', 'r2', 'r3', 'r4', 'm1', 'm2', 'm3', 'm4']
+    links = [link['nodes'] for link in spec['links']]
+    assert len(links) == 6 + 4 + 6
+    assert ['leaf3', 'spine2'] in links
+    assert ['r4', 'r1'] in links
+    assert ['m2', 'm4'] in links
+
+    with pytest.raises(ValueError):
+        expand_spec({'generators': [{'type': 'torus'}]})
+    with pytest.raises(KeyError):
+        expand_spec({'routers': {'r1': {}}, 'links': [['r1', 'r2']]})
+
+def test_addresses():
+    "Test the link and loopback address allocation"
+
+    spec = expand_spec({
+        'generators': [{'type': 'ring', 'routers': 3, 'asn': 65001}],
+        'routers': {'r1': {'asn': 65100}},
+        'switches': ['s1'],
+        'links': [['r1', 's1']],
+        'link_prefix': '10.0.0.0/28',
+        'loopback_prefix': '10.255.0.0/24',
+    })
+    assert [link['addresses'] for link in spec['links']] == [
+        ['10.0.0.1/30', '10.0.0.2/30'],
+        ['10.0.0.5/30', '10.0.0.6/30'],
+        ['10.0.0.9/30', '10.0.0.10/30'],
+        [None, None],
+    ]
+    assert spec['routers']['r1']['asn'] == 65100
+    assert spec['routers']['r3']['loopback'] == '10.255.0.3/32'
+
+    # The third link doesn't fit in a /29 anymore
+    with pytest.raises(ValueError):
+        expand_spec({'generators': [{'type': 'ring', 'routers': 3}],
+                     'link_prefix': '10.0.0.0/29'})
+
+def test_router_vars():
+    "Test the template variables and rendering"
+
+    spec = expand_spec({
+        'generators': [{'type': 'clos', 'spines': 2, 'leaves': 1,
+                        'spine_asn': 65000, 'leaf_asn': 65100}],
+        'routers': {'leaf1': {'vars': {'vni': 10}}},
+        'link_prefix': '10.0.0.0/24',
+        'link_prefixlen': 31,
+    })
+    for link in spec['links']:
+        link['ifnames'] = ['{}-eth{}'.format(name, spec['links'].index(link))
+                           for name in link['nodes']]
+
+    variables = router_vars('leaf1', spec['routers']['leaf1'], spec['links'],
+                            spec['routers'])
+    assert variables['interfaces'] == (
+        'interface leaf1-eth0\n ip address 10.0.0.0/31\n!\n'
+        'interface leaf1-eth1\n ip address 10.0.0.2/31\n!')
+    assert render_config('router bgp {asn}\n{bgp_neighbors}\n! {vni}',
+                         variables) == (
+        'router bgp 65100\n'
+        ' neighbor 10.0.0.1 remote-as 65000\n'
+        ' neighbor 10.0.0.3 remote-as 65000\n'
+        '! 10')
+    assert render_config(lambda v: v['name'], variables) == 'leaf1'
+
+def test_render_config_file(tmpdir):
+    "Template file names are relative to the directory and must exist."
+    tmpdir.join('bgpd.conf.tmpl').write('router bgp {asn}\n')
+    directory = str(tmpdir)
+    assert render_config('bgpd.conf.tmpl', {'asn': 65000},
+                         directory) == 'router bgp 65000\n'
+    assert render_config('hostname {name}', {'name': 'r1'},
+                         directory) == 'hostname r1'
+    with pytest.raises(IOError):
+        render_config('bgp.conf.tmpl', {}, directory)
+    with pytest.raises(IOError):
+        render_config('templates/bgpd.conf', {}, directory)
+
+if __name__ == '__main__':
+    sys.exit(pytest.main())
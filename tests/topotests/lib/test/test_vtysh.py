@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+#
+# test_vtysh.py
+# Tests for library functions: split_vtysh_echo().
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS DISCLAIM ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Tests for the parsing of `vtysh -E` output.
+"""
+
+import os
+import sys
+import json
+import pytest
+
+# Save the Current Working Directory to find lib files.
+CWD = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(CWD, '../../'))
+
+# pylint: disable=C0413
+from lib.topotest import split_vtysh_echo
+
+# Output of `vtysh -E -c ... -c ...` read from a Mininet node (pty line
+# endings): JSON output doesn't end in a new line.
+ECHO_OUTPUT = (
+    'r1# show ip route 10.0.0.0/24 json\r\n'
+    '{"10.0.0.0/24":[{"prefix":"10.0.0.0/24","protocol":"connected"}]}'
+    'r1# show interface brief\r\n'
+    'Interface       Status  VRF             Addresses\r\n'
+    '---------       ------  ---             ---------\r\n'
+    'r1-eth0         up      default         10.0.0.1/24\r\n'
+    '\r\n'
+    'r1# configure terminal\r\n'
+    'r1(config)# router bgp 65000\r\n'
+    'r1(config-router)# no bgp ebgp-requires-policy\r\n')
+
+def test_split():
+    "Every echoed command starts the output of the command."
+    commands = ['show ip route 10.0.0.0/24 json', 'show interface brief',
+                'configure terminal', 'router bgp 65000',
+                'no bgp ebgp-requires-policy']
+    outputs, config = split_vtysh_echo(ECHO_OUTPUT, commands)
+    assert len(outputs) == 5
+    assert json.loads(outputs[0])['10.0.0.0/24'][0]['protocol'] == 'connected'
+    assert outputs[1].startswith('Interface ')
+    assert 'r1-eth0         up' in outputs[1]
+    assert '\r' not in outputs[1]
+    assert outputs[2:] == ['', '', '']
+    assert config
+
+def test_split_failure():
+    "vtysh exits after a failing command, the next ones aren't echoed."
+    output = ('r1# show ip bgp summary\r\n'
+              '% Unknown command: show ip bgp summary\r\n')
+    outputs, config = split_vtysh_echo(
+        output, ['show ip bgp summary', 'show version'])
+    assert outputs == ['% Unknown command: show ip bgp summary\n']
+    assert not config
+
+    # No daemons to connect to: nothing is echoed
+    assert split_vtysh_echo('', ['show version']) == ([], False)
+
+if __name__ == '__main__':
+    sys.exit(pytest.main())
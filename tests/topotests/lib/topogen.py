@@ -42,6 +42,9 @@ import os
 import sys
 import logging
 import json
+import hashlib
+import pipes
+import re
 
 if sys.version_info[0] > 2:
     import configparser
@@ -53,13 +56,17 @@ import grp
 import platform
 import pwd
 import subprocess
+import threading
 import pytest
 
+from multiprocessing.pool import ThreadPool
+
 from mininet.net import Mininet
 from mininet.log import setLogLevel
 from mininet.cli import CLI
 
 from lib import topotest
+from lib import topospec
 from lib.topolog import logger, logger_config
 
 CWD = os.path.dirname(os.path.realpath(__file__))
@@ -95,8 +102,51 @@ tgen_defaults = {
     'quaggadir': '/usr/lib/quagga',
     'routertype': 'frr',
     'memleak_path': None,
+    'router_start_jobs': '0',
+    'vtysh_sessions': 'false',
+    'topology_reuse': 'false',
 }
 
+# Linux interface names are limited to IFNAMSIZ - 1 characters.
+IFNAME_MAX = 15
+
+# Network kept running after stop_topology() when `topology_reuse` is
+# enabled, as a (fingerprint, Mininet, kernel states) tuple.
+reusable_net = None
+
+def topology_fingerprint(topo, bulk_links=()):
+    """
+    Returns a digest of the nodes (and their parameters) and links of the
+    mininet topology `topo` plus the `bulk_links` of Topogen. Log
+    directories are not taken into account.
+    """
+    def encode(value):
+        if isinstance(value, type):
+            return '{}.{}'.format(value.__module__, value.__name__)
+        return repr(value)
+
+    nodes = []
+    for name in topo.nodes(sort=True):
+        params = dict(topo.nodeInfo(name))
+        params.pop('logdir', None)
+        nodes.append([name, params])
+    links = [list(link) for link in topo.links(sort=True, withInfo=True)]
+    links += [[node1.nodename, ifname1, node2.nodename, ifname2]
+              for node1, ifname1, node2, ifname2 in bulk_links]
+    data = json.dumps([nodes, links], sort_keys=True, default=encode)
+    return hashlib.sha256(data).hexdigest()
+
+def flush_topology():
+    "Stops the network kept for reuse, if any."
+    # pylint: disable=W0603
+    global reusable_net
+    if reusable_net is None:
+        return
+    _, net, _ = reusable_net
+    reusable_net = None
+    logger.info('stopping reused topology')
+    net.stop()
+
 class Topogen(object):
     "A topology test builder helper."
 
@@ -118,14 +168,34 @@ class Topogen(object):
         self.errorsd = {}
         self.errors = ''
         self.peern = 1
+        self.lock = threading.Lock()
+        self.bulk_links = []
+        self.spec_configs = []
         self._init_topo(cls)
         logger.info('loading topology: {}'.format(self.modname))
 
     @staticmethod
     def _mininet_reset():
         "Reset the mininet environment"
-        # Clean up the mininet environment
-        os.system('mn -c > /dev/null 2>&1')
+        prefix = topotest.worker_prefix()
+        if prefix == '':
+            # Clean up the mininet environment
+            os.system('mn -c > /dev/null 2>&1')
+            return
+
+        # Other workers are using mininet: only remove the bridges and
+        # interfaces a previous run of this worker may have left behind.
+        bridges = subprocess.Popen(['ovs-vsctl', 'list-br'],
+                                   stdout=subprocess.PIPE).communicate()[0]
+        for bridge in bridges.split():
+            if bridge.startswith(prefix):
+                os.system('ovs-vsctl --if-exists del-br {}'.format(bridge))
+        links = subprocess.Popen(['ip', '-o', 'link', 'show'],
+                                 stdout=subprocess.PIPE).communicate()[0]
+        for link in links.splitlines():
+            ifname = link.split(':')[1].strip().split('@')[0]
+            if ifname.startswith(prefix):
+                os.system('ip link del {} > /dev/null 2>&1'.format(ifname))
 
     def _init_topo(self, cls):
         """
@@ -145,14 +215,161 @@ class Topogen(object):
             self.hasmpls = True
         # Load the default topology configurations
         self._load_config()
+        self.reuse = self.config.getboolean(self.CONFIG_SECTION,
+                                            'topology_reuse')
+        self.reused = False
+        self.fingerprint = None
+        self.kernel_states = {}
 
         # Initialize the API
-        self._mininet_reset()
-        cls()
-        self.net = Mininet(controller=None, topo=self.topo)
+        with topotest.timed('setup', 'mininet({})'.format(self.modname)):
+            self._init_net(cls)
+            if not self.reused:
+                self._create_bulk_links()
         for gear in self.gears.values():
             gear.net = self.net
 
+    def _init_net(self, cls):
+        "Builds the topology class and creates (or reuses) its network."
+        if not self.reuse:
+            self._mininet_reset()
+            cls()
+            self.net = Mininet(controller=None, topo=self.topo)
+        else:
+            # Building the topology class doesn't touch the system, check
+            # whether the network of the previous module can be reused.
+            cls()
+            self.fingerprint = topology_fingerprint(self.topo, self.bulk_links)
+            self.net = self._take_reusable_net()
+            if self.net is None:
+                flush_topology()
+                self._mininet_reset()
+                self.net = Mininet(controller=None, topo=self.topo)
+
+    def _take_reusable_net(self):
+        "Returns the kept network if it was built from the same topology."
+        # pylint: disable=W0603
+        global reusable_net
+        if reusable_net is None or reusable_net[0] != self.fingerprint:
+            return None
+        _, net, self.kernel_states = reusable_net
+        reusable_net = None
+        self.reused = True
+        logger.info('reusing topology of a previous module')
+        return net
+
+    def _reset_topology(self):
+        """
+        Prepares a reused network: routers forget the daemons (and
+        configurations) of the previous module and all links are set up.
+        """
+        for gear in self.gears.values():
+            node = self.net[gear.nodename]
+            if isinstance(gear, TopoRouter):
+                node.reset(gear.logdir)
+            for ifname in node.intfNames():
+                if ifname != 'lo':
+                    node.cmd('ip link set dev {} up'.format(ifname))
+        self._bulk_links_up(reset=True)
+
+    def _namespace_gears(self):
+        "Returns the gears with their own network namespace (not switches)."
+        return [gear for gear in self.gears.values()
+                if not isinstance(gear, TopoSwitch)]
+
+    def _save_kernel_states(self):
+        "Saves the kernel state of the new network, see _clean_topology()."
+        for gear in self._namespace_gears():
+            self.kernel_states[gear.nodename] = topotest.save_kernel_state(
+                self.net[gear.nodename])
+
+    def _clean_topology(self):
+        """
+        Undoes the kernel changes made by the test module (links, routes,
+        routing rules and sysctls) so the network can be reused. Returns
+        what could not be undone: the network must not be reused then.
+        """
+        # Bulk links are kept, they are reset by _bulk_links_up().
+        bulk_ifnames = {}
+        for node1, ifname1, node2, ifname2 in self.bulk_links:
+            bulk_ifnames.setdefault(node1.nodename, []).append(ifname1)
+            bulk_ifnames.setdefault(node2.nodename, []).append(ifname2)
+
+        problems = []
+        for gear in self._namespace_gears():
+            state = self.kernel_states.get(gear.nodename)
+            if state is None:
+                problems.append('{}: no saved kernel state'.format(gear.nodename))
+                continue
+            problems += ['{}: {}'.format(gear.nodename, problem)
+                         for problem in topotest.reset_kernel_state(
+                             self.net[gear.nodename], state,
+                             bulk_ifnames.get(gear.nodename, []))]
+        return problems
+
+    def _ip_batch(self, commands, nodename=None):
+        """
+        Runs the `ip` commands with a single `ip -batch`, in the node
+        `nodename` or in the root namespace. Returns the error messages.
+        """
+        fname = topotest.get_file('\n'.join(commands) + '\n')
+        try:
+            if nodename is None:
+                proc = subprocess.Popen(['ip', '-force', '-batch', fname],
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT)
+                output = proc.communicate()[0]
+            else:
+                output = self.net[nodename].cmd(
+                    'ip -force -batch {} 2>&1'.format(fname))
+        finally:
+            os.unlink(fname)
+        return output.strip()
+
+    def _create_bulk_links(self):
+        """
+        Creates the veth pairs of the links added with `bulk=True`. Both ends
+        are created directly in the router namespaces, so the interface
+        names never clash in the root namespace.
+        """
+        if not self.bulk_links:
+            return
+
+        logger.info('creating {} links in bulk'.format(len(self.bulk_links)))
+        commands = []
+        for node1, ifname1, node2, ifname2 in self.bulk_links:
+            commands.append(
+                'link add {} netns {} type veth peer name {} netns {}'.format(
+                    ifname1, self.net[node1.nodename].pid,
+                    ifname2, self.net[node2.nodename].pid))
+        errors = self._ip_batch(commands)
+        if errors:
+            self.set_error('bulk link creation failed: {}'.format(errors))
+        self._bulk_links_up()
+
+    def _bulk_links_up(self, reset=False):
+        """
+        Sets the bulk links up, with one `ip -batch` per router. With
+        `reset` (reused network) the interfaces are first released from
+        their master, set down and their addresses are flushed.
+        """
+        ifnames = {}
+        for node1, ifname1, node2, ifname2 in self.bulk_links:
+            ifnames.setdefault(node1.nodename, []).append(ifname1)
+            ifnames.setdefault(node2.nodename, []).append(ifname2)
+        for nodename in sorted(ifnames):
+            commands = []
+            for ifname in ifnames[nodename]:
+                if reset:
+                    commands += ['link set dev {} nomaster'.format(ifname),
+                                 'link set dev {} down'.format(ifname),
+                                 'address flush dev {}'.format(ifname)]
+                commands.append('link set dev {} up'.format(ifname))
+            errors = self._ip_batch(commands, nodename)
+            if errors:
+                self.set_error('{}: bulk link setup failed: {}'.format(
+                    nodename, errors))
+
     def _load_config(self):
         """
         Loads the configuration file `pytest.ini` located at the root dir of
@@ -179,6 +396,8 @@ class Topogen(object):
         params['frrdir'] = self.config.get(self.CONFIG_SECTION, 'frrdir')
         params['quaggadir'] = self.config.get(self.CONFIG_SECTION, 'quaggadir')
         params['memleak_path'] = self.config.get(self.CONFIG_SECTION, 'memleak_path')
+        params['vtysh_sessions'] = self.config.getboolean(self.CONFIG_SECTION,
+                                                          'vtysh_sessions')
         if not params.has_key('routertype'):
             params['routertype'] = self.config.get(self.CONFIG_SECTION, 'routertype')
 
@@ -218,13 +437,17 @@ class Topogen(object):
         self.peern += 1
         return self.gears[name]
 
-    def add_link(self, node1, node2, ifname1=None, ifname2=None):
+    def add_link(self, node1, node2, ifname1=None, ifname2=None, bulk=False):
         """
         Creates a connection between node1 and node2. The nodes can be the
         following:
         * TopoGear
           * TopoRouter
           * TopoSwitch
+
+        With `bulk` the link (only between routers) is not created by Mininet
+        one by one: all bulk links are created with a single `ip -batch`
+        once the routers exist, which is much faster for large topologies.
         """
         if not isinstance(node1, TopoGear):
             raise ValueError('invalid node1 type')
@@ -235,12 +458,100 @@ class Topogen(object):
             ifname1 = node1.new_link()
         if ifname2 is None:
             ifname2 = node2.new_link()
+        for ifname in (ifname1, ifname2):
+            # Switch interfaces get the worker prefix, see TopoSwitch.
+            if len(ifname) > IFNAME_MAX:
+                raise ValueError(
+                    'interface name {} is longer than {} characters{}'.format(
+                        ifname, IFNAME_MAX,
+                        ' (with worker prefix {})'.format(topotest.worker_prefix())
+                        if topotest.worker_prefix() else ''))
+
+        if bulk and not (isinstance(node1, TopoRouter) and
+                         isinstance(node2, TopoRouter)):
+            raise ValueError('bulk links are only supported between routers')
 
         node1.register_link(ifname1, node2, ifname2)
         node2.register_link(ifname2, node1, ifname1)
-        self.topo.addLink(node1.name, node2.name,
+        if bulk:
+            self.bulk_links.append((node1, ifname1, node2, ifname2))
+            return
+        self.topo.addLink(node1.nodename, node2.nodename,
                           intfName1=ifname1, intfName2=ifname2)
 
+    def add_topology(self, spec):
+        """
+        Adds the routers, switches and links of a declarative topology
+        specification: a dictionary or the name of a JSON/YAML file, see
+        lib/topospec.py for the format. Links between routers are bulk
+        links (see add_link()) unless the specification sets `bulk_links`
+        to false.
+
+        The daemon configurations rendered from the `config` templates are
+        saved in the router log directories and loaded by start_topology().
+        The specification file and template file names are relative to the
+        directory of the test calling add_topology(), unless the
+        specification dictionary sets another `directory`.
+
+        Usage example (in the topology build() method):
+        ```py
+        tgen = get_topogen(self)
+        tgen.add_topology({
+            'generators': [{'type': 'clos', 'spines': 4, 'leaves': 64,
+                            'spine_asn': 65000, 'leaf_asn': 65100}],
+            'link_prefix': '10.0.0.0/16',
+            'loopback_prefix': '10.255.0.0/16',
+            'config': {
+                'zebra': '{interfaces}\n',
+                'bgpd': 'router bgp {asn}\n bgp router-id {router_id}\n'
+                        ' no bgp ebgp-requires-policy\n{bgp_neighbors}\n',
+            },
+        })
+        ```
+
+        Returns the expanded specification (see topospec.expand_spec()).
+        """
+        # File names are relative to the directory of the calling test.
+        # pylint: disable=W0212
+        directory = os.path.dirname(os.path.abspath(
+            sys._getframe(1).f_code.co_filename))
+        if not isinstance(spec, dict):
+            spec = topospec.load_spec(os.path.join(directory, spec))
+        elif 'directory' not in spec:
+            spec = dict(spec, directory=directory)
+        expanded = topospec.expand_spec(spec)
+
+        for name, router in expanded['routers'].items():
+            self.add_router(name, **router['params'])
+        for name in expanded['switches']:
+            self.add_switch(name)
+
+        bulk = spec.get('bulk_links', True)
+        for link in expanded['links']:
+            node1, node2 = [self.gears[name] for name in link['nodes']]
+            link['ifnames'] = [node1.new_link(), node2.new_link()]
+            self.add_link(node1, node2, link['ifnames'][0], link['ifnames'][1],
+                          bulk=(bulk and isinstance(node1, TopoRouter) and
+                                isinstance(node2, TopoRouter)))
+
+        daemons = dict([(daemon, rd) for rd, daemon in TopoRouter.RD.items()])
+        templates = spec.get('config', {})
+        for daemon in templates:
+            if daemon not in daemons:
+                raise KeyError('unknown daemon {}'.format(daemon))
+        for name, router in expanded['routers'].items():
+            gear = self.gears[name]
+            variables = topospec.router_vars(name, router, expanded['links'],
+                                             expanded['routers'])
+            for daemon, template in templates.items():
+                fname = os.path.join(gear.logdir, name, '{}.conf'.format(daemon))
+                with open(fname, 'w') as fconf:
+                    fconf.write(topospec.render_config(
+                        template, variables, spec.get('directory')))
+                self.spec_configs.append((gear, daemons[daemon], fname))
+
+        return expanded
+
     def get_gears(self, geartype):
         """
         Returns a dictionary of all gears of type `geartype`.
@@ -300,17 +611,48 @@ class Topogen(object):
             setLogLevel(log_level)
 
         logger.info('starting topology: {}'.format(self.modname))
-        self.net.start()
+        with topotest.timed('setup', 'start_topology({})'.format(self.modname)):
+            if self.reused:
+                self._reset_topology()
+            else:
+                self.net.start()
+                if self.reuse:
+                    self._save_kernel_states()
+
+        # Configurations rendered by add_topology()
+        for router, daemon, fname in self.spec_configs:
+            router.load_config(daemon, fname)
 
     def start_router(self, router=None):
         """
         Call the router startRouter method.
         If no router is specified it is called for all registred routers.
+
+        Routers live in their own namespaces, so when starting all of them
+        they are started concurrently (`router_start_jobs` in `pytest.ini`
+        limits how many at once, 0 means all). Daemons inside a router are
+        still started in order by `Router.restartRouter()`.
         """
         if router is None:
-            # pylint: disable=r1704
-            for _, router in self.routers().iteritems():
-                router.start()
+            router_list = sorted(self.routers().values(),
+                                 key=lambda r: r.name)
+            jobs = self.config.getint(self.CONFIG_SECTION, 'router_start_jobs')
+            if jobs <= 0 or jobs > len(router_list):
+                jobs = len(router_list)
+            if jobs <= 1:
+                for router in router_list:
+                    router.start()
+                return
+
+            logger.info('starting {} routers ({} at a time)'.format(
+                len(router_list), jobs))
+            pool = ThreadPool(jobs)
+            try:
+                # map() re-raises the first exception of any router start.
+                pool.map(lambda r: r.start(), router_list)
+            finally:
+                pool.close()
+                pool.join()
         else:
             if isinstance(router, str):
                 router = self.gears[router]
@@ -324,6 +666,12 @@ class Topogen(object):
         their oportunity to do a graceful shutdown. stop() is called twice. The
         first is a simple kill with no sleep, the second will sleep if not
         killed and try with a different signal.
+
+        When `topology_reuse` is enabled in `pytest.ini` the network is kept
+        running (only the daemons are stopped and the kernel changes of the
+        module are undone) so the next module can use it if it builds the
+        same topology, see flush_topology(). A network whose kernel state
+        can't be restored is stopped instead.
         """
         logger.info('stopping topology: {}'.format(self.modname))
         errors = ""
@@ -334,6 +682,16 @@ class Topogen(object):
         if len(errors) > 0:
             assert "Errors found post shutdown - details follow:" == 0, errors
 
+        if self.reuse:
+            problems = self._clean_topology()
+            if not problems:
+                # pylint: disable=W0603
+                global reusable_net
+                reusable_net = (self.fingerprint, self.net, self.kernel_states)
+                return
+            logger.info('not keeping the topology for reuse: {}'.format(
+                ', '.join(problems)))
+
         self.net.stop()
 
     def mininet_cli(self):
@@ -376,12 +734,14 @@ class Topogen(object):
         "Sets an error message and signal other tests to skip."
         logger.info(message)
 
-        # If no code is defined use a sequential number
-        if code is None:
-            code = len(self.errorsd)
+        # Routers may be started concurrently, see start_router().
+        with self.lock:
+            # If no code is defined use a sequential number
+            if code is None:
+                code = len(self.errorsd)
 
-        self.errorsd[code] = message
-        self.errors += '\n{}: {}'.format(code, message)
+            self.errorsd[code] = message
+            self.errors += '\n{}: {}'.format(code, message)
 
     def has_errors(self):
         "Returns whether errors exist or not."
@@ -415,6 +775,8 @@ class TopoGear(object):
     def __init__(self):
         self.tgen = None
         self.name = None
+        # Name of the mininet node, see TopoSwitch
+        self.nodename = None
         self.cls = None
         self.links = {}
         self.linkn = 0
@@ -443,7 +805,14 @@ class TopoGear(object):
         Runs the provided command string in the router and returns a string
         with the response.
         """
-        return self.tgen.net[self.name].cmd(command)
+        return self.tgen.net[self.nodename].cmd(command)
+
+    def popen(self, *params, **kwargs):
+        """
+        Starts a process in the node (see mininet's Node.popen()) and returns
+        its `subprocess.Popen` object.
+        """
+        return self.tgen.net[self.nodename].popen(*params, **kwargs)
 
     def add_link(self, node, myif=None, nodeif=None):
         """
@@ -497,7 +866,7 @@ class TopoGear(object):
 
         NOTE: This function should only be called by Topogen.
         """
-        ifname = '{}-eth{}'.format(self.name, self.linkn)
+        ifname = '{}-eth{}'.format(self.nodename, self.linkn)
         self.linkn += 1
         return ifname
 
@@ -569,6 +938,7 @@ class TopoRouter(TopoGear):
         self.tgen = tgen
         self.net = None
         self.name = name
+        self.nodename = name
         self.cls = cls
         self.options = {}
         self.routertype = params.get('routertype', 'frr')
@@ -576,9 +946,12 @@ class TopoRouter(TopoGear):
             params['privateDirs'] = self.PRIVATE_DIRS
 
         self.options['memleak_path'] = params.get('memleak_path', None)
+        self.options['vtysh_sessions'] = params.pop('vtysh_sessions', False)
+        self.vtysh_sessions = {}
 
         # Create new log directory
-        self.logdir = '/tmp/topotests/{}'.format(self.tgen.modname)
+        self.logdir = '{}/{}'.format(topotest.worker_logdir(),
+                                     self.tgen.modname)
         # Clean up before starting new log files: avoids removing just created
         # log files.
         self._prepare_tmpfiles()
@@ -661,6 +1034,8 @@ class TopoRouter(TopoGear):
         * Configure daemon logging files
         """
         self.logger.debug('starting')
+        # Sessions connected to the previous daemons are useless now
+        self.close_vtysh_sessions()
         nrouter = self.tgen.net[self.name]
         result = nrouter.startRouter(self.tgen)
 
@@ -683,8 +1058,32 @@ class TopoRouter(TopoGear):
         * Kill daemons
         """
         self.logger.debug('stopping')
+        self.close_vtysh_sessions()
         return self.tgen.net[self.name].stopRouter(wait, assertOnError)
 
+    def close_vtysh_sessions(self):
+        "Terminates the persistent vtysh sessions, see vtysh_cmd()."
+        for session in self.vtysh_sessions.values():
+            session.close()
+        self.vtysh_sessions = {}
+
+    def _vtysh_session_cmd(self, command, daemon):
+        """
+        Runs `command` (or a list of commands) in the persistent vtysh
+        session for `daemon` (all daemons when `None`). Returns `None` if the
+        session is not usable.
+        """
+        session = self.vtysh_sessions.get(daemon)
+        if session is None:
+            session = topotest.VtyshSession(self.tgen.net[self.name], daemon)
+            self.vtysh_sessions[daemon] = session
+        try:
+            return session.execute(command)
+        except (IOError, OSError) as error:
+            self.logger.warning('vtysh session failed ({}), using vtysh -c'.format(
+                error))
+            return None
+
     def vtysh_cmd(self, command, isjson=False, daemon=None):
         """
         Runs the provided command string in the vty shell and returns a string
@@ -692,18 +1091,30 @@ class TopoRouter(TopoGear):
 
         This function also accepts multiple commands, but this mode does not
         return output for each command. See vtysh_multicmd() for more details.
+
+        Single commands are sent through a vtysh process kept open for the
+        router (one per `daemon`) when `vtysh_sessions` is enabled in
+        `pytest.ini`. If the session fails the command is run with
+        `vtysh -c` instead.
         """
         # Detect multi line commands
         if command.find('\n') != -1:
             return self.vtysh_multicmd(command, daemon=daemon)
 
-        dparam = ''
-        if daemon is not None:
-            dparam += '-d {}'.format(daemon)
+        with topotest.timed('vtysh', '{}: {}'.format(self.name, command)):
+            output = None
+            if self.options['vtysh_sessions']:
+                output = self._vtysh_session_cmd(command, daemon)
 
-        vtysh_command = 'vtysh {} -c "{}" 2>/dev/null'.format(dparam, command)
+            if output is None:
+                dparam = ''
+                if daemon is not None:
+                    dparam += '-d {}'.format(daemon)
 
-        output = self.run(vtysh_command)
+                vtysh_command = 'vtysh {} -c "{}" 2>/dev/null'.format(
+                    dparam, command)
+
+                output = self.run(vtysh_command)
         self.logger.info('\nvtysh command => {}\nvtysh output <= {}'.format(
             command, output))
         if isjson is False:
@@ -723,6 +1134,8 @@ class TopoRouter(TopoGear):
         pretty_output: defines how the return value will be presented. When
         True it will show the command as they were executed in the vty shell,
         otherwise it will only show lines that failed.
+
+        Use vtysh_batch() to get the output of each command.
         """
         # Prepare the temporary file that will hold the commands
         fname = topotest.get_file(commands)
@@ -737,7 +1150,8 @@ class TopoRouter(TopoGear):
         else:
             vtysh_command = 'vtysh {} -f {}'.format(dparam, fname)
 
-        res = self.run(vtysh_command)
+        with topotest.timed('vtysh', '{}: {}'.format(self.name, vtysh_command)):
+            res = self.run(vtysh_command)
         os.unlink(fname)
 
         self.logger.info('\nvtysh command => "{}"\nvtysh output <= "{}"'.format(
@@ -745,6 +1159,82 @@ class TopoRouter(TopoGear):
 
         return res
 
+    def _vtysh_batch_run(self, commands, daemon):
+        """
+        Runs `commands` with `vtysh -E -c ... -c ...` and splits the output
+        using the echoed prompts. vtysh exits after a failing command, the
+        following commands are run by a new vtysh unless the failure was in a
+        configuration node (its context would be lost).
+        """
+        dparam = ''
+        if daemon is not None:
+            dparam += '-d {} '.format(daemon)
+
+        outputs = []
+        while len(outputs) < len(commands):
+            remaining = commands[len(outputs):]
+            cparams = ' '.join(['-c {}'.format(pipes.quote(command))
+                                for command in remaining])
+            output = self.run(
+                "vtysh {}-E {} 2>/dev/null; printf '\\nstatus: %d\\n' $?".format(
+                    dparam, cparams))
+            output, _, status = output.rpartition('\nstatus: ')
+            done, config = topotest.split_vtysh_echo(output, remaining)
+            outputs += done
+            if status.strip() == '0' or not done:
+                break
+            if config and len(outputs) < len(commands):
+                self.logger.warning(
+                    'vtysh: "{}" failed, skipping the next {} commands'.format(
+                        remaining[len(done) - 1], len(commands) - len(outputs)))
+                break
+
+        # vtysh stopped early (e.g. no daemons to connect to)
+        outputs += [''] * (len(commands) - len(outputs))
+        return outputs
+
+    def vtysh_batch(self, commands, daemon=None):
+        """
+        Runs a list of commands (a multi line string is split in lines) in a
+        single vtysh session and returns a list with the output of each
+        command, in the same order. The output of commands ending in `json`
+        is returned decoded (`{}` if it is not valid JSON).
+
+        Configuration commands may be batched too, e.g.:
+        ```py
+        router.vtysh_batch(['configure terminal', 'router bgp 65000',
+                            'no bgp ebgp-requires-policy'])
+        ```
+        """
+        if not isinstance(commands, list):
+            commands = [command for command in commands.splitlines()
+                        if command.strip() != '']
+        if not commands:
+            return []
+
+        with topotest.timed('vtysh', '{}: batch of {} commands'.format(
+                self.name, len(commands))):
+            outputs = None
+            if self.options['vtysh_sessions']:
+                outputs = self._vtysh_session_cmd(commands, daemon)
+            if outputs is None:
+                outputs = self._vtysh_batch_run(commands, daemon)
+
+        result = []
+        for command, output in zip(commands, outputs):
+            self.logger.info('\nvtysh command => {}\nvtysh output <= {}'.format(
+                command, output))
+            if command.split()[-1] != 'json':
+                result.append(output)
+                continue
+            try:
+                result.append(json.loads(output))
+            except ValueError:
+                logger.warning('vtysh_batch: failed to convert json output of "{}"'.format(
+                    command))
+                result.append({})
+        return result
+
     def report_memory_leaks(self, testname):
         """
         Runs the router memory leak check test. Has the following parameter:
@@ -807,6 +1297,10 @@ class TopoSwitch(TopoGear):
     Switch abstraction. Has the following properties:
     * cls: switch class that will be used to instantiate
     * name: switch name
+
+    Switches (and their interfaces) live in the host namespace, so when
+    running in parallel workers the mininet node name gets the worker
+    prefix (e.g. 'gw1-s1').
     """
     # pylint: disable=too-few-public-methods
 
@@ -815,8 +1309,12 @@ class TopoSwitch(TopoGear):
         self.tgen = tgen
         self.net = None
         self.name = name
+        self.nodename = topotest.worker_prefix() + name
         self.cls = cls
-        self.tgen.topo.addSwitch(name, cls=self.cls)
+        params = {}
+        if self.nodename != name:
+            params['dpid'] = topotest.worker_dpid(self.nodename)
+        self.tgen.topo.addSwitch(self.nodename, cls=self.cls, **params)
 
     def __str__(self):
         gear = super(TopoSwitch, self).__str__()
@@ -840,6 +1338,7 @@ class TopoHost(TopoGear):
         self.tgen = tgen
         self.net = None
         self.name = name
+        self.nodename = name
         self.options = params
         self.tgen.topo.addHost(name, **params)
 
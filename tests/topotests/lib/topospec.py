@@ -0,0 +1,306 @@
+#
+# topospec.py
+# Declarative topology specifications for Topogen
+#
+# Permission to use, copy, modify, and/or distribute this software
+# for any purpose with or without fee is hereby granted, provided
+# that the above copyright notice and this permission notice appear
+# in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHORS DISCLAIM ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY
+# DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS,
+# WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS
+# ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR PERFORMANCE
+# OF THIS SOFTWARE.
+#
+
+"""
+Declarative topology specifications, expanded by Topogen.add_topology().
+
+A specification is a dictionary (or a JSON/YAML file containing one):
+
+```py
+{
+    # Routers built by generators: 'clos', 'ring' and 'mesh'
+    'generators': [
+        {'type': 'clos', 'spines': 2, 'leaves': 16,
+         'spine_asn': 65000, 'leaf_asn': 65100},
+    ],
+    # Routers (add_router() parameters plus template 'asn' and 'vars'),
+    # switches and links (router to router or router to switch) to add
+    'routers': {'leaf1': {'vars': {'vni': 100}}},
+    'switches': ['s1'],
+    'links': [['leaf1', 's1']],
+    # Address pools: one subnet per router to router link and one /32
+    # loopback address per router
+    'link_prefix': '10.0.0.0/16',
+    'link_prefixlen': 30,
+    'loopback_prefix': '10.255.0.0/16',
+    # Per daemon configuration templates (a string, a file name or a
+    # function receiving the router variables)
+    'config': {'zebra': '{interfaces}', 'bgpd': 'bgpd.conf.tmpl'},
+    # Directory of the template files (defaults to the directory of the
+    # specification file or of the test)
+    'directory': '/path/to/test',
+}
+```
+
+Templates are formatted with str.format() and the router variables:
+`name`, `index`, `asn`, `router_id`, `loopback`, `links` (list of
+dictionaries with `ifname`, `address`, `peer`, `peer_ifname`,
+`peer_address` and `peer_asn`), the pre-rendered `interfaces` (zebra
+interface addresses) and `bgp_neighbors` blocks and the router `vars`.
+"""
+
+import errno
+import json
+import os
+import re
+import socket
+import struct
+
+from collections import OrderedDict
+
+def load_spec(fname):
+    """
+    Loads a specification from a JSON or YAML (needs PyYAML) file. File
+    names of templates are relative to the specification file.
+    """
+    with open(fname) as fspec:
+        if fname.endswith('.yaml') or fname.endswith('.yml'):
+            import yaml
+            spec = yaml.safe_load(fspec)
+        else:
+            spec = json.load(fspec)
+    spec.setdefault('directory', os.path.dirname(os.path.abspath(fname)))
+    return spec
+
+def ip4_to_int(address):
+    "Converts a dotted IPv4 address to an integer."
+    return struct.unpack('!I', socket.inet_aton(address))[0]
+
+def int_to_ip4(value):
+    "Converts an integer to a dotted IPv4 address."
+    return socket.inet_ntoa(struct.pack('!I', value))
+
+class address_pool(object):
+    """
+    Allocates consecutive subnets of `prefixlen` bits from the IPv4
+    `prefix` (e.g. '10.0.0.0/16').
+    """
+
+    def __init__(self, prefix, prefixlen):
+        network, plen = prefix.split('/')
+        self.plen = int(plen)
+        self.prefixlen = prefixlen
+        if not self.plen <= prefixlen <= 32:
+            raise ValueError('invalid subnet length {} for {}'.format(
+                prefixlen, prefix))
+        self.base = ip4_to_int(network) & (0xffffffff << (32 - self.plen))
+        self.size = 1 << (32 - prefixlen)
+        self.count = 1 << (prefixlen - self.plen)
+
+    def subnet(self, index):
+        "Returns the integer address of subnet `index` (starting at 0)."
+        if index >= self.count:
+            raise ValueError('address pool {}/{} exhausted'.format(
+                int_to_ip4(self.base), self.plen))
+        return self.base + index * self.size
+
+    def link_addresses(self, index):
+        "Returns both addresses (with prefix length) of point-to-point link `index`."
+        subnet = self.subnet(index)
+        # /31 and /32 links use all addresses, skip the network address
+        # otherwise.
+        first = 0 if self.prefixlen >= 31 else 1
+        last = first if self.prefixlen == 32 else first + 1
+        return ['{}/{}'.format(int_to_ip4(subnet + offset), self.prefixlen)
+                for offset in (first, last)]
+
+def _clos(gen):
+    """
+    Two tier Clos: every leaf connects to every spine. All spines share
+    `spine_asn`, leaves get `leaf_asn` + (leaf number - 1).
+    """
+    spines = ['{}{}'.format(gen.get('spine', 'spine'), i)
+              for i in range(1, gen['spines'] + 1)]
+    leaves = ['{}{}'.format(gen.get('leaf', 'leaf'), i)
+              for i in range(1, gen['leaves'] + 1)]
+    routers = [(spine, gen.get('spine_asn')) for spine in spines]
+    for i, leaf in enumerate(leaves):
+        asn = gen.get('leaf_asn')
+        routers.append((leaf, asn + i if asn is not None else None))
+    links = [[leaf, spine] for leaf in leaves for spine in spines
+             for _ in range(gen.get('parallel', 1))]
+    return (routers, links)
+
+def _generated_routers(gen):
+    "Routers of the ring and mesh generators, numbered from 1."
+    asn = gen.get('asn')
+    return [('{}{}'.format(gen.get('name', 'r'), i),
+             asn + i - 1 if asn is not None else None)
+            for i in range(1, gen['routers'] + 1)]
+
+def _ring(gen):
+    "Ring: each router connects to the next one, the last to the first."
+    routers = _generated_routers(gen)
+    names = [name for name, _ in routers]
+    links = [[names[i], names[i + 1]] for i in range(len(names) - 1)]
+    if len(names) > 2:
+        links.append([names[-1], names[0]])
+    return (routers, links)
+
+def _mesh(gen):
+    "Full mesh: every router connects to every other router."
+    routers = _generated_routers(gen)
+    names = [name for name, _ in routers]
+    links = [[names[i], names[j]] for i in range(len(names))
+             for j in range(i + 1, len(names))]
+    return (routers, links)
+
+GENERATORS = {
+    'clos': _clos,
+    'ring': _ring,
+    'mesh': _mesh,
+}
+
+def expand_spec(spec):
+    """
+    Expands the generators of `spec` and allocates the addresses. Returns a
+    dictionary with:
+    * 'routers': OrderedDict of name to dictionary with 'params' (for
+      add_router()), 'index', 'asn', 'router_id', 'loopback' and 'vars'
+    * 'switches': list of switch names
+    * 'links': list of dictionaries with 'nodes' (both node names) and
+      'addresses' (both addresses, None for links to switches)
+    """
+    routers = OrderedDict()
+    links = []
+
+    def add(name, params=None, asn=None):
+        router = routers.get(name)
+        if router is None:
+            router = routers[name] = {
+                'params': {},
+                'index': len(routers) + 1,
+                'asn': asn,
+                'vars': {},
+            }
+        params = dict(params or {})
+        if 'asn' in params:
+            router['asn'] = params.pop('asn')
+        router['vars'].update(params.pop('vars', {}))
+        router['params'].update(params)
+
+    for gen in spec.get('generators', []):
+        if gen.get('type') not in GENERATORS:
+            raise ValueError('unknown topology generator: {}'.format(gen.get('type')))
+        grouters, glinks = GENERATORS[gen['type']](gen)
+        for name, asn in grouters:
+            add(name, asn=asn)
+        links.extend(glinks)
+
+    # Explicit routers may change the parameters of generated ones
+    for name, params in spec.get('routers', {}).items():
+        add(name, params)
+    switches = list(spec.get('switches', []))
+    links.extend(spec.get('links', []))
+
+    loopbacks = None
+    if spec.get('loopback_prefix') is not None:
+        loopbacks = address_pool(spec['loopback_prefix'], 32)
+    for router in routers.values():
+        router['router_id'] = None
+        router['loopback'] = None
+        if loopbacks is not None:
+            router['router_id'] = int_to_ip4(loopbacks.subnet(router['index']))
+            router['loopback'] = '{}/32'.format(router['router_id'])
+
+    pool = None
+    if spec.get('link_prefix') is not None:
+        pool = address_pool(spec['link_prefix'], spec.get('link_prefixlen', 30))
+    result = []
+    nlink = 0
+    for link in links:
+        for name in link:
+            if name not in routers and name not in switches:
+                raise KeyError('link to unknown node {}'.format(name))
+        addresses = [None, None]
+        if pool is not None and link[0] in routers and link[1] in routers:
+            addresses = pool.link_addresses(nlink)
+            nlink += 1
+        result.append({'nodes': list(link), 'addresses': addresses})
+
+    return {'routers': routers, 'switches': switches, 'links': result}
+
+def router_vars(name, router, links, routers):
+    """
+    Returns the template variables of router `name`. `links` are the
+    expanded links with the interface names ('ifnames') filled in.
+    """
+    rlinks = []
+    for link in links:
+        for mine, peer in ((0, 1), (1, 0)):
+            if link['nodes'][mine] != name:
+                continue
+            peer_name = link['nodes'][peer]
+            peer_address = link['addresses'][peer]
+            rlinks.append({
+                'ifname': link['ifnames'][mine],
+                'address': link['addresses'][mine],
+                'peer': peer_name,
+                'peer_ifname': link['ifnames'][peer],
+                'peer_address': peer_address,
+                'peer_asn': routers[peer_name]['asn'] if peer_name in routers else None,
+            })
+
+    interfaces = []
+    if router['loopback'] is not None:
+        interfaces.append('interface lo\n ip address {}\n!'.format(router['loopback']))
+    for link in rlinks:
+        if link['address'] is not None:
+            interfaces.append('interface {}\n ip address {}\n!'.format(
+                link['ifname'], link['address']))
+
+    neighbors = ['neighbor {} remote-as {}'.format(
+        link['peer_address'].split('/')[0], link['peer_asn'])
+                 for link in rlinks
+                 if link['peer_address'] is not None and link['peer_asn'] is not None]
+
+    variables = {
+        'name': name,
+        'index': router['index'],
+        'asn': router['asn'],
+        'router_id': router['router_id'],
+        'loopback': router['loopback'],
+        'links': rlinks,
+        'interfaces': '\n'.join(interfaces),
+        'bgp_neighbors': '\n'.join([' ' + neighbor for neighbor in neighbors]),
+    }
+    variables.update(router['vars'])
+    return variables
+
+def render_config(template, variables, directory=None):
+    """
+    Renders a configuration template: a function called with the variables,
+    the name of a template file (relative to `directory`) or the template
+    text itself. A single line without spaces or braces that contains a
+    dot or a slash is a file name: IOError is raised if the file doesn't
+    exist.
+    """
+    if callable(template):
+        return template(variables)
+
+    if '\n' not in template:
+        fname = template
+        if directory is not None:
+            fname = os.path.join(directory, template)
+        if os.path.isfile(fname):
+            with open(fname) as ftemplate:
+                template = ftemplate.read()
+        elif re.match(r'^[^\s{}]*[./][^\s{}]*$', template):
+            raise IOError(errno.ENOENT, 'template file not found', fname)
+    return template.format(**variables)
@@ -35,6 +35,13 @@ import tempfile
 import platform
 import difflib
 import time
+import select
+import itertools
+import threading
+import zlib
+import heapq
+import contextlib
+import pipes
 
 from lib.topolog import logger
 
@@ -49,16 +56,42 @@ class json_cmp_result(object):
     "json_cmp result class for better assertion messages"
 
     def __init__(self):
-        self.errors = []
+        self.entries = []
+        self.incomplete = None
 
     def add_error(self, error):
         "Append error message to the result"
-        for line in error.splitlines():
-            self.errors.append(line)
+        self.entries.append(error)
+
+    def add_diff_error(self, prefix, d1, d2, suffix=''):
+        """
+        Append error message with the difference between `d1` and `d2`.
+        The difference is only rendered when the errors are read.
+        """
+        self.entries.append((prefix, d1, d2, suffix))
 
     def has_errors(self):
         "Returns True if there were errors, otherwise False."
-        return len(self.errors) > 0
+        return len(self.entries) > 0
+
+    @property
+    def errors(self):
+        "List of error message lines."
+        # json_cmp() stops at the first error, redo the comparison in full
+        # now that someone wants to read them.
+        if self.incomplete is not None:
+            d1, d2 = self.incomplete
+            self.incomplete = None
+            self.entries = []
+            _json_cmp(d1, d2, self, stop=False)
+
+        lines = []
+        for i, entry in enumerate(self.entries):
+            if isinstance(entry, tuple):
+                prefix, d1, d2, suffix = entry
+                entry = self.entries[i] = prefix + json_diff(d1, d2) + suffix
+            lines.extend(entry.splitlines())
+        return lines
 
     def __str__(self):
         return '\n'.join(self.errors)
@@ -77,57 +110,125 @@ def json_diff(d1, d2):
     return difflines(dstr2, dstr1, title1='Expected value', title2='Current value', n=0)
 
 
+class json_list_index(object):
+    """
+    Lazily built indexes of the items of a JSON list, by the value of one of
+    their fields (or by the item value for scalar items).
+
+    An item can only match an expected item if the values of the expected
+    scalar fields are equal, so only the items sharing the value of one of
+    them have to be compared. `HINTS` lists the preferred identifying fields.
+    """
+
+    HINTS = ['prefix', 'network', 'ip', 'address', 'nexthop', 'interfaceName',
+             'interface', 'neighbor', 'peer', 'id', 'name']
+
+    # Lists smaller than this are just scanned.
+    MIN_SIZE = 16
+
+    def __init__(self, items):
+        self.items = items
+        self.indexes = {}
+
+    def _index(self, key):
+        index = self.indexes.get(key)
+        if index is not None:
+            return index
+
+        index = {}
+        for item in self.items:
+            if key is None:
+                value = item
+            elif isinstance(item, dict) and key in item:
+                value = item[key]
+            else:
+                continue
+            if isinstance(value, (dict, list)):
+                continue
+            index.setdefault(value, []).append(item)
+        self.indexes[key] = index
+        return index
+
+    def _hint(self, key):
+        try:
+            return (0, self.HINTS.index(key), key)
+        except ValueError:
+            return (1, 0, key)
+
+    def candidates(self, expected):
+        "Returns the items that might match `expected`."
+        if len(self.items) < self.MIN_SIZE or isinstance(expected, list):
+            return self.items
+
+        if not isinstance(expected, dict):
+            return self._index(None).get(expected, [])
+
+        keys = [key for key, value in expected.items()
+                if value is not None and not isinstance(value, (dict, list))]
+        if not keys:
+            return self.items
+        key = min(keys, key=self._hint)
+        return self._index(key).get(expected[key], [])
+
+
+def _json_match(d1, d2):
+    "Returns True if json_cmp(d1, d2) would not find errors in `d1`."
+    if isinstance(d2, dict):
+        if not isinstance(d1, dict):
+            return False
+        for key, value in d2.iteritems():
+            if value is None:
+                if key in d1:
+                    return False
+            elif key not in d1 or not _json_match(d1[key], value):
+                return False
+        return True
+
+    if isinstance(d2, list):
+        if not isinstance(d1, list) or len(d2) > len(d1):
+            return False
+        index = json_list_index(d1)
+        for expected in d2:
+            # json_cmp() treats it as a key that must not exist
+            if expected is None:
+                return False
+            for value in index.candidates(expected):
+                if _json_match(value, expected):
+                    break
+            else:
+                return False
+        return True
+
+    return d1 == d2
+
+
 def _json_list_cmp(list1, list2, parent, result):
     "Handles list type entries."
     # Check second list2 type
     if not isinstance(list1, type([])) or not isinstance(list2, type([])):
-        result.add_error(
+        result.add_diff_error(
             '{} has different type than expected '.format(parent) +
-            '(have {}, expected {}):\n{}'.format(
-                type(list1), type(list2), json_diff(list1, list2)))
+            '(have {}, expected {}):\n'.format(type(list1), type(list2)),
+            list1, list2)
         return
 
     # Check list size
     if len(list2) > len(list1):
-        result.add_error(
+        result.add_diff_error(
             '{} too few items '.format(parent) +
-            '(have {}, expected {}:\n {})'.format(
-                len(list1), len(list2),
-                json_diff(list1, list2)))
+            '(have {}, expected {}:\n '.format(len(list1), len(list2)),
+            list1, list2, ')')
         return
 
-    # List all unmatched items errors
-    unmatched = []
-    for expected in list2:
-        matched = False
-        for value in list1:
-            if json_cmp({'json': value}, {'json': expected}) is None:
-                matched = True
-                break
-
-        if not matched:
-            unmatched.append(expected)
+    # Error out on the first unmatched item.
+    if not _json_match(list1, list2):
+        result.add_diff_error(
+            '{} value is different (\n'.format(parent), list1, list2, ')')
 
-    # If there are unmatched items, error out.
-    if unmatched:
-        result.add_error(
-            '{} value is different (\n{})'.format(
-                parent, json_diff(list1, list2)))
-
-
-def json_cmp(d1, d2):
-    """
-    JSON compare function. Receives two parameters:
-    * `d1`: json value
-    * `d2`: json subset which we expect
-
-    Returns `None` when all keys that `d1` has matches `d2`,
-    otherwise a string containing what failed.
 
-    Note: key absence can be tested by adding a key with value `None`.
-    """
+def _json_cmp(d1, d2, result, stop):
+    "json_cmp() implementation, returns on the first error if `stop` is set."
     squeue = [(d1, d2, 'json')]
-    result = json_cmp_result()
 
     for s in squeue:
         nd1, nd2, parent = s
@@ -135,33 +236,35 @@ def json_cmp(d1, d2):
         # Handle JSON beginning with lists.
         if isinstance(nd1, type([])) or isinstance(nd2, type([])):
             _json_list_cmp(nd1, nd2, parent, result)
-            if result.has_errors():
-                return result
-            else:
-                return None
+            return
 
         # Expect all required fields to exist.
         s1, s2 = set(nd1), set(nd2)
         s2_req = set([key for key in nd2 if nd2[key] is not None])
         diff = s2_req - s1
         if diff != set({}):
-            result.add_error('expected key(s) {} in {} (have {}):\n{}'.format(
-                str(list(diff)), parent, str(list(s1)), json_diff(nd1, nd2)))
+            result.add_diff_error('expected key(s) {} in {} (have {}):\n'.format(
+                str(list(diff)), parent, str(list(s1))), nd1, nd2)
+            if stop:
+                return
 
         for key in s2.intersection(s1):
+            if stop and result.has_errors():
+                return
+
             # Test for non existence of key in d2
             if nd2[key] is None:
-                result.add_error('"{}" should not exist in {} (have {}):\n{}'.format(
-                    key, parent, str(s1), json_diff(nd1[key], nd2[key])))
+                result.add_diff_error('"{}" should not exist in {} (have {}):\n'.format(
+                    key, parent, str(s1)), nd1[key], nd2[key])
                 continue
 
             # If nd1 key is a dict, we have to recurse in it later.
             if isinstance(nd2[key], type({})):
                 if not isinstance(nd1[key], type({})):
-                    result.add_error(
+                    result.add_diff_error(
                         '{}["{}"] has different type than expected '.format(parent, key) +
-                        '(have {}, expected {}):\n{}'.format(
-                            type(nd1[key]), type(nd2[key]), json_diff(nd1[key], nd2[key])))
+                        '(have {}, expected {}):\n'.format(
+                            type(nd1[key]), type(nd2[key])), nd1[key], nd2[key])
                     continue
                 nparent = '{}["{}"]'.format(parent, key)
                 squeue.append((nd1[key], nd2[key], nparent))
@@ -174,12 +277,34 @@ def json_cmp(d1, d2):
 
             # Compare JSON values
             if nd1[key] != nd2[key]:
-                result.add_error(
-                    '{}["{}"] value is different (\n{})'.format(
-                        parent, key, json_diff(nd1[key], nd2[key])))
+                result.add_diff_error(
+                    '{}["{}"] value is different (\n'.format(parent, key),
+                    nd1[key], nd2[key], ')')
                 continue
 
+        if stop and result.has_errors():
+            return
+
+
+def json_cmp(d1, d2):
+    """
+    JSON compare function. Receives two parameters:
+    * `d1`: json value
+    * `d2`: json subset which we expect
+
+    Returns `None` when all keys that `d1` has matches `d2`,
+    otherwise a string containing what failed.
+
+    Note: key absence can be tested by adding a key with value `None`.
+
+    The comparison stops at the first difference, the remaining ones (and
+    the diff text) are only computed when the result errors are read. List
+    items are matched using a `json_list_index`.
+    """
+    result = json_cmp_result()
+    _json_cmp(d1, d2, result, stop=True)
     if result.has_errors():
+        result.incomplete = (d1, d2)
         return result
 
     return None
@@ -203,15 +328,258 @@ def router_json_cmp(router, cmd, data):
     return json_cmp(router.vtysh_cmd(cmd, isjson=True), data)
 
 
-def run_and_expect(func, what, count=20, wait=3):
+# Serializes writes to the convergence results file.
+convergence_lock = threading.Lock()
+
+def convergence_file():
+    """
+    Returns the file where run_and_expect() appends its convergence times
+    (JSON, one object per line). It can be set with the environment
+    variable TOPOTESTS_CONVERGENCE_FILE.
+    """
+    return (os.environ.get('TOPOTESTS_CONVERGENCE_FILE') or
+            os.path.join(worker_logdir(), 'convergence.json'))
+
+def reset_convergence_file():
+    """
+    Empties the convergence_file(), called once per pytest session. A file
+    set with TOPOTESTS_CONVERGENCE_FILE is shared by the pytest-xdist
+    workers, so only the controller empties it.
+    """
+    if os.environ.get('TOPOTESTS_CONVERGENCE_FILE') and worker_id():
+        return
+    try:
+        os.unlink(convergence_file())
+    except OSError as error:
+        if error.errno != errno.ENOENT:
+            logger.warning('could not reset convergence times: {}'.format(error))
+
+def _func_name(func):
+    "Returns a descriptive name of a run_and_expect() function."
+    args = ()
+    if func.__class__ == functools.partial:
+        args = func.args
+        func = func.func
+    name = getattr(func, '__name__', '<unknown>')
+    # Most helpers take the router as first argument
+    if args and hasattr(args[0], 'name'):
+        name = '{}({})'.format(name, args[0].name)
+    return name
+
+def record_convergence(func_name, success, elapsed, attempts):
+    "Appends a run_and_expect() result to the convergence_file()."
+    entry = {
+        'test': os.environ.get('PYTEST_CURRENT_TEST', '').split(' ')[0],
+        'func': func_name,
+        'success': success,
+        'time': round(elapsed, 3),
+        'attempts': attempts,
+    }
+    fname = convergence_file()
+    with convergence_lock:
+        try:
+            if not os.path.isdir(os.path.dirname(fname)):
+                os.makedirs(os.path.dirname(fname))
+            with open(fname, 'a') as fde:
+                fde.write(json.dumps(entry, sort_keys=True) + '\n')
+        except (IOError, OSError) as error:
+            logger.warning('could not record convergence time: {}'.format(error))
+
+
+# Time accounting of the library entry points (see timed()), reported by
+# conftest.py for each test and module.
+timing_lock = threading.Lock()
+timing_state = threading.local()
+timing_tests = {}
+
+# Categories reported as sleeping, everything else is work.
+TIMING_SLEEP = ('sleep', 'poll-wait')
+# Number of slowest calls kept for each test.
+TIMING_SLOWEST = 10
+
+def timing_file():
+    """
+    Returns the file where the time accounting report is written (JSON). It
+    can be set with the environment variable TOPOTESTS_TIMING_FILE.
+    """
+    return (os.environ.get('TOPOTESTS_TIMING_FILE') or
+            os.path.join(worker_logdir(), 'timing.json'))
+
+def _timing_entry(nodeid):
+    "Returns the accounting entry of test `nodeid`, timing_lock must be held."
+    entry = timing_tests.get(nodeid)
+    if entry is None:
+        entry = timing_tests[nodeid] = {
+            'duration': 0.0,
+            'categories': {},
+            'slowest': [],
+        }
+    return entry
+
+@contextlib.contextmanager
+def timed(category, name=None):
+    """
+    Accounts the wall time spent in the block to `category` for the current
+    test. Nested blocks are subtracted from the time of the enclosing block
+    ('self' time), so categories don't count the same time twice.
+    """
+    if getattr(timing_state, 'disabled', False):
+        yield
+        return
+
+    stack = getattr(timing_state, 'stack', None)
+    if stack is None:
+        stack = timing_state.stack = []
+    frame = [time.time(), 0.0]
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+        elapsed = time.time() - frame[0]
+        if stack:
+            stack[-1][1] += elapsed
+        record_time(category, name or category, elapsed, elapsed - frame[1])
+
+def timed_method(category):
+    "Decorator accounting the calls of a node method to `category`."
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with timed(category, self.name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_time(category, name, elapsed, self_time):
+    "Accounts a call of `elapsed` seconds to `category` for the current test."
+    nodeid = os.environ.get('PYTEST_CURRENT_TEST', '').split(' ')[0]
+    with timing_lock:
+        entry = _timing_entry(nodeid)
+        counters = entry['categories'].setdefault(category, [0, 0.0, 0.0])
+        counters[0] += 1
+        counters[1] += elapsed
+        counters[2] += self_time
+        call = (elapsed, category, name)
+        if len(entry['slowest']) < TIMING_SLOWEST:
+            heapq.heappush(entry['slowest'], call)
+        else:
+            heapq.heappushpop(entry['slowest'], call)
+
+def record_test_duration(nodeid, duration):
+    "Adds the duration of a test phase (setup, call or teardown)."
+    with timing_lock:
+        _timing_entry(nodeid)['duration'] += duration
+
+def _timing_summary(entries):
+    "Merges accounting entries into a report item."
+    duration = 0.0
+    categories = {}
+    slowest = []
+    for entry in entries:
+        duration += entry['duration']
+        for category, (count, elapsed, self_time) in entry['categories'].items():
+            counters = categories.setdefault(category, [0, 0.0, 0.0])
+            counters[0] += count
+            counters[1] += elapsed
+            counters[2] += self_time
+        slowest.extend(entry['slowest'])
+
+    sleep = sum([categories[category][2] for category in TIMING_SLEEP
+                 if category in categories])
+    return {
+        'duration': round(duration, 3),
+        'sleep': round(sleep, 3),
+        'work': round(max(duration - sleep, 0.0), 3),
+        'categories': dict([
+            (category, {
+                'count': count,
+                'time': round(elapsed, 3),
+                'self': round(self_time, 3),
+            })
+            for category, (count, elapsed, self_time) in categories.items()]),
+        'slowest': [
+            {'category': category, 'name': name, 'time': round(elapsed, 3)}
+            for elapsed, category, name in heapq.nlargest(TIMING_SLOWEST, slowest)],
+    }
+
+def timing_report():
+    """
+    Returns the time accounting of the tests run so far, with one item for
+    each test and module. Each item has the test duration, the time spent
+    sleeping (topotest.sleep() and run_and_expect() waits) and working, the
+    count and time of each category and the slowest calls.
+    """
+    with timing_lock:
+        tests = dict([(nodeid, dict(entry, slowest=list(entry['slowest'])))
+                      for nodeid, entry in timing_tests.items()])
+
+    modules = {}
+    for nodeid, entry in tests.items():
+        modules.setdefault(nodeid.split('::')[0], []).append(entry)
+    return {
+        'tests': dict([(nodeid, _timing_summary([entry]))
+                       for nodeid, entry in tests.items()]),
+        'modules': dict([(module, _timing_summary(entries))
+                         for module, entries in modules.items()]),
+        'total': _timing_summary(tests.values()),
+    }
+
+def write_timing_report(report=None):
+    "Writes the timing_report() to the timing_file()."
+    if report is None:
+        report = timing_report()
+    fname = timing_file()
+    try:
+        if not os.path.isdir(os.path.dirname(fname)):
+            os.makedirs(os.path.dirname(fname))
+        with open(fname, 'w') as fde:
+            json.dump(report, fde, indent=2, sort_keys=True)
+    except (IOError, OSError) as error:
+        logger.warning('could not write time accounting report: {}'.format(error))
+
+def timing_summary_lines(report=None, slowest=TIMING_SLOWEST):
+    "Formats the timing_report() for the pytest terminal summary."
+    if report is None:
+        report = timing_report()
+    if not report['tests']:
+        return []
+
+    line = '{:>9} {:>9} {:>9}  {}'
+    lines = [line.format('total', 'sleep', 'work', 'module')]
+    modules = sorted(report['modules'].items(),
+                     key=lambda item: item[1]['duration'], reverse=True)
+    for module, item in modules + [('TOTAL', report['total'])]:
+        lines.append(line.format(
+            '{:.2f}s'.format(item['duration']), '{:.2f}s'.format(item['sleep']),
+            '{:.2f}s'.format(item['work']), module or '<no test>'))
+
+    calls = []
+    for nodeid, item in report['tests'].items():
+        calls.extend([(call['time'], call['category'], call['name'], nodeid)
+                      for call in item['slowest']])
+    if calls:
+        lines.append('')
+        lines.append('slowest calls:')
+    for elapsed, category, name, nodeid in heapq.nlargest(slowest, calls):
+        lines.append('{:>9} {:<10} {} ({})'.format(
+            '{:.2f}s'.format(elapsed), category, name, nodeid or '<no test>'))
+    return lines
+
+
+def run_and_expect(func, what, count=20, wait=3, initial_wait=0.1):
     """
-    Run `func` and compare the result with `what`. Do it for `count` times
-    waiting `wait` seconds between tries. By default it tries 20 times with
-    3 seconds delay between tries.
+    Run `func` and compare the result with `what`. Keep trying for at most
+    `count` * `wait` seconds (by default 20 * 3 seconds) plus the time spent
+    running `func`: the first retry happens after `initial_wait` seconds
+    and the interval doubles on each try up to `wait` seconds. Use
+    `initial_wait=wait` to poll at a fixed interval.
 
     Returns (True, func-return) on success or
     (False, func-return) on failure.
 
+    The time it took is recorded in the convergence_file().
+
     ---
 
     Helper functions to use with this function:
@@ -219,32 +587,119 @@ def run_and_expect(func, what, count=20, wait=3):
     - router_json_cmp
     """
     start_time = time.time()
-    func_name = "<unknown>"
-    if func.__class__ == functools.partial:
-        func_name = func.func.__name__
-    else:
-        func_name = func.__name__
+    func_name = _func_name(func)
 
     logger.info(
-        "'{}' polling started (interval {} secs, maximum wait {} secs)".format(
-            func_name, wait, int(wait * count)))
-
-    while count > 0:
-        result = func()
-        if result != what:
-            time.sleep(wait)
-            count -= 1
-            continue
+        "'{}' polling started (interval {}-{} secs, maximum wait {} secs)".format(
+            func_name, min(initial_wait, wait), wait, int(wait * count)))
 
-        end_time = time.time()
+    with timed('poll', func_name):
+        success, result, attempts = _poll(func, what, start_time + count * wait,
+                                          initial_wait, wait)
+    end_time = time.time()
+    if success:
         logger.info("'{}' succeeded after {:.2f} seconds".format(
             func_name, end_time - start_time))
-        return (True, result)
+    else:
+        logger.error("'{}' failed after {:.2f} seconds".format(
+            func_name, end_time - start_time))
+    record_convergence(func_name, success, end_time - start_time, attempts)
+    return (success, result)
 
-    end_time = time.time()
-    logger.error("'{}' failed after {:.2f} seconds".format(
-        func_name, end_time - start_time))
-    return (False, result)
+
+def _poll(func, what, deadline, initial_wait, wait):
+    """
+    run_and_expect() polling loop, returns (success, func-return, number of
+    calls). The time spent in `func` extends the deadline, so slow checks
+    get as much time to converge as before.
+    """
+    func_name = _func_name(func)
+    interval = min(initial_wait, wait)
+    attempts = 0
+    while True:
+        start = time.time()
+        result = func()
+        attempts += 1
+        if result == what:
+            return (True, result, attempts)
+
+        now = time.time()
+        deadline += now - start
+        if now >= deadline:
+            return (False, result, attempts)
+        with timed('poll-wait', func_name):
+            time.sleep(min(interval, deadline - now))
+        interval = min(interval * 2, wait)
+
+
+def run_and_expect_all(funcs, what, count=20, wait=3, initial_wait=0.1):
+    """
+    Concurrent version of run_and_expect(): `funcs` maps keys (normally
+    routers or router names) to functions that are polled in parallel, until
+    all of them return `what` or the shared deadline of `count` * `wait`
+    seconds (plus the time spent running each function) expires.
+
+    Returns (True, {}, times) if all functions succeeded, otherwise
+    (False, failures, times), where `failures` maps the keys of the functions
+    that did not succeed to their last return value and `times` maps all
+    keys to the seconds they took.
+
+    Usage example:
+    ```py
+    funcs = dict((router, functools.partial(topotest.router_json_cmp, router,
+                                            'show ip ospf neighbor json',
+                                            expected[router.name]))
+                 for router in tgen.routers().values())
+    success, failures, _ = topotest.run_and_expect_all(funcs, None)
+    assert success, '\n'.join(['{}: {}'.format(router.name, result)
+                               for router, result in failures.items()])
+    ```
+    """
+    start_time = time.time()
+    deadline = start_time + count * wait
+    outcomes = {}
+
+    logger.info(
+        "polling {} functions (interval {}-{} secs, maximum wait {} secs)".format(
+            len(funcs), min(initial_wait, wait), wait, int(wait * count)))
+
+    def poll(key):
+        # The time of the threads is accounted to run_and_expect_all()
+        timing_state.disabled = True
+        try:
+            success, result, attempts = _poll(funcs[key], what, deadline,
+                                              initial_wait, wait)
+        except Exception as error:
+            success, result, attempts = False, error, 0
+        outcomes[key] = (success, result, time.time() - start_time, attempts)
+
+    threads = []
+    with timed('poll', 'run_and_expect_all({} functions)'.format(len(funcs))):
+        for key in funcs:
+            thread = threading.Thread(target=poll, args=(key,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    failures = {}
+    times = {}
+    for key, (success, result, elapsed, attempts) in outcomes.items():
+        func_name = _func_name(funcs[key])
+        times[key] = elapsed
+        record_convergence(func_name, success, elapsed, attempts)
+        if success:
+            logger.info("'{}' succeeded after {:.2f} seconds".format(
+                func_name, elapsed))
+        else:
+            logger.error("'{}' failed after {:.2f} seconds".format(
+                func_name, elapsed))
+            failures[key] = result
+
+    logger.info('polling finished after {:.2f} seconds ({} failures)'.format(
+        time.time() - start_time, len(failures)))
+    return (len(failures) == 0, failures, times)
 
 
 def int2dpid(dpid):
@@ -259,6 +714,37 @@ def int2dpid(dpid):
                         'please either specify a dpid or use a '
                         'canonical switch name such as s23.')
 
+def worker_id():
+    """
+    Returns the pytest-xdist worker id (e.g. 'gw0') or an empty string when
+    tests are not running in parallel workers.
+    """
+    return os.environ.get('PYTEST_XDIST_WORKER', '')
+
+def worker_prefix():
+    """
+    Returns the prefix for names living in the host namespace (bridges,
+    switch interfaces) that must not collide with other workers.
+    """
+    worker = worker_id()
+    if worker == '':
+        return ''
+    return worker + '-'
+
+def worker_logdir():
+    "Returns the base log directory of this worker."
+    worker = worker_id()
+    if worker == '':
+        return '/tmp/topotests'
+    return '/tmp/topotests/' + worker
+
+def worker_dpid(name):
+    """
+    Returns an unique datapath id for switch `name`: mininet derives it from
+    the digits of the name, which repeat across worker prefixes.
+    """
+    return int2dpid(zlib.crc32(name) & 0xffffffff)
+
 def pid_exists(pid):
     "Check whether pid exists in the current process table."
 
@@ -280,6 +766,19 @@ def pid_exists(pid):
     else:
         return True
 
+def pids_wait_exit(pids, timeout=10, interval=0.1):
+    """
+    Polls until all processes in `pids` exited or `timeout` seconds passed.
+
+    Returns the list of pids that are still running.
+    """
+    deadline = time.time() + timeout
+    running = [pid for pid in pids if pid_exists(pid)]
+    while running and time.time() < deadline:
+        time.sleep(interval)
+        running = [pid for pid in running if pid_exists(pid)]
+    return running
+
 def get_textdiff(text1, text2, title1="", title2="", **opts):
     "Returns empty string if same or formatted diff"
 
@@ -449,6 +948,7 @@ def ip4_route(node):
     """
     Gets a structured return of the command 'ip route'. It can be used in
     conjuction with json_cmp() to provide accurate assert explanations.
+    See kernel_routes() for VRFs/tables and big routing tables.
 
     Return example:
     {
@@ -489,6 +989,7 @@ def ip6_route(node):
     """
     Gets a structured return of the command 'ip -6 route'. It can be used in
     conjuction with json_cmp() to provide accurate assert explanations.
+    See kernel_routes() for VRFs/tables and big routing tables.
 
     Return example:
     {
@@ -524,6 +1025,134 @@ def ip6_route(node):
 
     return result
 
+def _kernel_route_entry(route):
+    "Compact form of a route from 'ip -json route'."
+    entry = {}
+    if 'dev' in route:
+        entry['dev'] = route['dev']
+    if 'gateway' in route:
+        entry['via'] = route['gateway']
+    elif 'via' in route:
+        entry['via'] = route['via'].get('host')
+    if 'protocol' in route:
+        # translate protocol names back to numbers
+        entry['proto'] = proto_name_to_number(str(route['protocol']))
+    for key in ['metric', 'scope', 'pref', 'type', 'table']:
+        if key in route:
+            entry[key] = route[key]
+    if 'prefsrc' in route:
+        entry['src'] = route['prefsrc']
+    if 'nexthops' in route:
+        nexthops = []
+        for nexthop in route['nexthops']:
+            hop = {}
+            if 'gateway' in nexthop:
+                hop['via'] = nexthop['gateway']
+            if 'dev' in nexthop:
+                hop['dev'] = nexthop['dev']
+            if 'weight' in nexthop:
+                hop['weight'] = nexthop['weight']
+            nexthops.append(hop)
+        entry['nexthops'] = sorted(nexthops,
+                                   key=lambda hop: (hop.get('via'), hop.get('dev')))
+    return entry
+
+def kernel_routes(node, family=4, vrf=None, table=None):
+    """
+    Gets a snapshot of the kernel routes of `node` using 'ip -json route'.
+    The result can be used with json_cmp() and kernel_routes_diff().
+
+    Parameters:
+    * `family`: 4 or 6
+    * `vrf`: only dump routes of this VRF
+    * `table`: only dump routes of this table (e.g. 10, 'local' or 'all')
+
+    Return example:
+    {
+        '10.0.1.0/24': {
+            'dev': 'eth0',
+            'via': '172.16.0.1',
+            'proto': '188',
+            'metric': 20,
+        },
+        '10.0.2.0/24': {
+            'nexthops': [
+                {'via': '172.16.0.1', 'dev': 'eth0', 'weight': 1},
+                {'via': '172.16.1.1', 'dev': 'eth1', 'weight': 1},
+            ],
+            'proto': '188',
+        }
+    }
+
+    Routes to the same destination (e.g. with different metrics, or in
+    different tables when dumping all of them) are keyed as
+    '<prefix> metric <metric>' / '<prefix> table <table>'.
+    """
+    args = ['ip', '-{}'.format(family), '-json', 'route', 'show']
+    if vrf is not None:
+        args += ['vrf', vrf]
+    if table is not None:
+        args += ['table', str(table)]
+
+    # Avoid the node shell, outputs can be large.
+    proc = node.popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, error = proc.communicate()
+    if proc.returncode != 0:
+        raise ValueError('{} failed: {}'.format(' '.join(args), error.strip()))
+    try:
+        routes = json.loads(output or '[]')
+    except ValueError:
+        raise ValueError('"{}" has no JSON support (iproute2 4.13 or newer '
+                         'is required)'.format(' '.join(args)))
+
+    result = {}
+    duplicates = set()
+    for route in routes:
+        prefix = route['dst']
+        entry = _kernel_route_entry(route)
+        if prefix in result or prefix in duplicates:
+            if prefix in result:
+                duplicates.add(prefix)
+                first = result.pop(prefix)
+                result[_kernel_route_key(prefix, first)] = first
+            prefix = _kernel_route_key(prefix, entry)
+        result[prefix] = entry
+    return result
+
+def _kernel_route_key(prefix, entry):
+    "Key for routes sharing the destination prefix, see kernel_routes()."
+    if 'table' in entry:
+        prefix = '{} table {}'.format(prefix, entry['table'])
+    if 'metric' in entry:
+        prefix = '{} metric {}'.format(prefix, entry['metric'])
+    return prefix
+
+def kernel_routes_diff(before, after):
+    """
+    Compares two kernel_routes() snapshots. Returns `None` if they are the
+    same, otherwise a dictionary with the routes that were `added`,
+    `removed` or `changed` (the latter as `(before, after)` tuples):
+    {
+        'added': {'10.0.3.0/24': {...}},
+        'removed': {},
+        'changed': {'10.0.1.0/24': ({...}, {...})},
+    }
+    """
+    added = dict((prefix, route) for prefix, route in after.iteritems()
+                 if prefix not in before)
+    removed = dict((prefix, route) for prefix, route in before.iteritems()
+                   if prefix not in after)
+    changed = dict((prefix, (route, after[prefix]))
+                   for prefix, route in before.iteritems()
+                   if prefix in after and after[prefix] != route)
+    if not added and not removed and not changed:
+        return None
+    return {
+        'added': added,
+        'removed': removed,
+        'changed': changed,
+    }
+
 def sleep(amount, reason=None):
     """
     Sleep wrapper that registers in the log the amount of sleep
@@ -533,7 +1162,8 @@ def sleep(amount, reason=None):
     else:
         logger.info(reason + ' ({} seconds)'.format(amount))
 
-    time.sleep(amount)
+    with timed('sleep', reason):
+        time.sleep(amount)
 
 def checkAddressSanitizerError(output, router, component):
     "Checks for AddressSanitizer in output. If found, then logs it and returns true, false otherwise"
@@ -589,6 +1219,327 @@ def assert_sysctl(node, sysctl, value):
     "Set and assert that the sysctl is set with the specified value."
     assert set_sysctl(node, sysctl, value) is None
 
+def _node_sysctls(node):
+    "Returns the writable network sysctls of `node` (file name to value)."
+    output = node.cmd(
+        "find /proc/sys/net -type f -perm -u+w -exec grep -H '' {} + 2>/dev/null")
+    values = {}
+    for line in output.splitlines():
+        fname, _, value = line.partition(':')
+        if fname in values:
+            values[fname] += '\n' + value
+        else:
+            values[fname] = value
+    return values
+
+def _node_rules(node):
+    "Returns the IPv4 and IPv6 policy routing rules of `node`."
+    return [node.cmd('ip {} rule show'.format(family)).strip()
+            for family in ('-4', '-6')]
+
+def save_kernel_state(node):
+    """
+    Returns the kernel state of the namespace of `node` that
+    reset_kernel_state() restores: network sysctls and routing rules.
+    """
+    return {'sysctls': _node_sysctls(node), 'rules': _node_rules(node)}
+
+def reset_kernel_state(node, state, keep=()):
+    """
+    Undoes the kernel changes made in the namespace of `node` since `state`
+    was saved by save_kernel_state(), so the node can be reused by another
+    test:
+    * links not created with the topology (e.g. VRF or bridge devices) are
+      deleted, the topology interfaces are released from their master,
+      set down and their addresses are flushed (interfaces in `keep` are
+      kept but not reset);
+    * routes of all tables but `local` and MPLS routes are flushed;
+    * routing rules and network sysctls are restored.
+    Returns a list with what could not be reset (empty on success).
+    """
+    intfs = [ifname for ifname in node.intfNames() if ifname != 'lo']
+    known = set(intfs) | set(keep) | set(['lo'])
+
+    def links():
+        output = node.cmd('ip -o link show')
+        return [line.split(':')[1].strip().split('@')[0]
+                for line in output.splitlines() if ':' in line]
+
+    commands = ['link del dev {}'.format(ifname)
+                for ifname in links() if ifname not in known]
+    for ifname in intfs:
+        commands += ['link set dev {} nomaster'.format(ifname),
+                     'link set dev {} down'.format(ifname),
+                     'address flush dev {}'.format(ifname)]
+    commands.append('address flush dev lo scope global')
+    fname = get_file('\n'.join(commands) + '\n')
+    try:
+        node.cmd('ip -force -batch {} > /dev/null 2>&1'.format(fname))
+    finally:
+        os.unlink(fname)
+
+    for family in ('-4', '-6'):
+        routes = node.cmd('ip {} route show table all'.format(family))
+        tables = set(re.findall(r'\btable (\S+)', routes)) | set(['main'])
+        tables.discard('local')
+        for table in sorted(tables):
+            node.cmd('ip {} route flush table {}'.format(family, table))
+    for line in node.cmd('ip -f mpls route show 2>/dev/null').splitlines():
+        if line.strip():
+            node.cmd('ip -f mpls route del {}'.format(line.split()[0]))
+
+    if _node_rules(node) != state['rules']:
+        # Flushing keeps the `local` lookup rule, add the default ones back.
+        node.cmd('ip -4 rule flush; ip -6 rule flush; '
+                 'ip -4 rule add pref 32766 table main; '
+                 'ip -4 rule add pref 32767 table default; '
+                 'ip -6 rule add pref 32766 table main')
+
+    # Global settings first, they may change the per interface ones.
+    def order(fname):
+        return ('/conf/all/' not in fname and '/conf/default/' not in fname,
+                fname)
+
+    current = _node_sysctls(node)
+    for fname in sorted(state['sysctls'], key=order):
+        value = state['sysctls'][fname]
+        if fname in current and current[fname] != value:
+            node.cmd("printf '%s\\n' {} > {} 2>/dev/null".format(
+                pipes.quote(value), fname))
+
+    problems = ['link {} not deleted'.format(ifname)
+                for ifname in links() if ifname not in known]
+    if _node_rules(node) != state['rules']:
+        problems.append('routing rules not restored')
+    current = _node_sysctls(node)
+    problems += ['sysctl {} not restored'.format(fname)
+                 for fname, value in sorted(state['sysctls'].items())
+                 if fname in current and current[fname] != value]
+    return problems
+
+
+class VtyshSession(object):
+    """
+    Persistent vtysh process running inside a router namespace.
+
+    vtysh is started once (optionally for a single `daemon`) and commands
+    are written to its standard input. Every command is followed by a marker
+    line that vtysh rejects as an unknown command, the error message for
+    the marker tells where the command output ends.
+
+    vtysh only connects to the daemons running when it starts, and prints
+    a warning in the command output when a connection breaks: vtysh is
+    started again when the running daemons change (e.g. a daemon was
+    started or killed) or if the process dies.
+    """
+
+    def __init__(self, node, daemon=None, timeout=120):
+        self.node = node
+        self.daemon = daemon
+        self.timeout = timeout
+        self.proc = None
+        self.buffer = ''
+        self.markers = itertools.count(1)
+        self.hostname = None
+        self.config_node = False
+        self.daemons = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def prompt(hostname=None):
+        """
+        Regular expression for the prompt printed by vtysh before reading a
+        line (the line is echoed after it). The hostname is learned from the
+        first prompt: output not ending in a new line is followed directly by
+        the next prompt.
+        """
+        if hostname is None:
+            hostname = r'[^\s#()]*'
+        else:
+            hostname = re.escape(hostname)
+        return r'({})(\([^)\s]*\))?# '.format(hostname)
+
+    def running_daemons(self):
+        """
+        Returns the pid files of the running daemons with their pid. Runs in
+        a new process, as the node shell isn't safe to use from threads.
+        """
+        script = ('for f in /var/run/{}/*.pid; do '
+                  'p=$(cat $f 2>/dev/null) && kill -0 $p 2>/dev/null && '
+                  'echo $f $p; done').format(getattr(self.node, 'routertype', 'frr'))
+        proc = self.node.popen(['sh', '-c', script], stdout=subprocess.PIPE,
+                               stderr=open(os.devnull, 'w'))
+        return proc.communicate()[0]
+
+    def is_open(self):
+        "Returns True if the vtysh process is running."
+        return self.proc is not None and self.proc.poll() is None
+
+    def open(self):
+        "Starts vtysh, closing a previous process if any."
+        self.close()
+        args = ['vtysh']
+        if self.daemon is not None:
+            args += ['-d', self.daemon]
+        env = dict(os.environ)
+        env.pop('VTYSH_PAGER', None)
+        self.proc = self.node.popen(args, stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=open(os.devnull, 'w'), env=env)
+        self.buffer = ''
+        self.hostname = None
+        self.config_node = False
+        # Skip the welcome banner
+        self._execute([''])
+
+    def close(self):
+        "Terminates the vtysh process."
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except IOError:
+            pass
+        if self.proc.poll() is None:
+            self.proc.terminate()
+        self.proc.wait()
+        self.proc = None
+
+    def _read_until(self, token):
+        "Reads vtysh output until `token`, returns the text before it."
+        fd = self.proc.stdout.fileno()
+        deadline = time.time() + self.timeout
+        while self.buffer.find(token) == -1:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise IOError('vtysh: timeout waiting for command output')
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise IOError('vtysh: session closed')
+            self.buffer += chunk
+        pos = self.buffer.find(token)
+        data = self.buffer[:pos]
+        self.buffer = self.buffer[pos + len(token):]
+        return data
+
+    def _receive(self, command, mark):
+        "Reads the output of `command`, which was followed by `mark`."
+        output = self._read_until('% Unknown command: {}\n'.format(mark))
+        output = output.replace('\r', '')
+
+        # Remove the prompt/echo of the marker and of the command.
+        tailre = '{}\n?$'.format(re.escape(mark))
+        tail = re.search(self.prompt(self.hostname) + tailre, output)
+        if tail is None:
+            # Hostname changed (or not known yet)
+            tail = re.search(self.prompt() + tailre, output)
+        if tail is not None:
+            self.hostname = tail.group(1)
+            self.config_node = tail.group(2) is not None
+            output = output[:tail.start()]
+        if 'Warning: closing connection to ' in output:
+            # Printed in the middle of the output of the command
+            raise IOError('vtysh: daemon connection closed')
+        head = re.match('{}(?:{}\n)?'.format(self.prompt(self.hostname),
+                                             re.escape(command)), output)
+        if head is not None:
+            output = output[head.end():]
+        return output
+
+    def _write(self, data, errors):
+        try:
+            self.proc.stdin.write(data)
+            self.proc.stdin.flush()
+        except (IOError, OSError) as error:
+            errors.append(error)
+
+    def _execute(self, commands):
+        marks = ['__topotest_mark_{}__'.format(next(self.markers))
+                 for _ in commands]
+        data = ''.join(['{}\n{}\n'.format(command, mark)
+                        for command, mark in zip(commands, marks)])
+
+        # Big batches are written from another thread, otherwise both
+        # vtysh and us could block on full pipes.
+        errors = []
+        writer = None
+        if len(data) <= select.PIPE_BUF:
+            self._write(data, errors)
+        else:
+            writer = threading.Thread(target=self._write, args=(data, errors))
+            writer.daemon = True
+            writer.start()
+
+        # On errors the caller terminates vtysh, which also fails the writer.
+        outputs = [self._receive(command, mark)
+                   for command, mark in zip(commands, marks)]
+        if writer is not None:
+            writer.join()
+        if errors:
+            raise errors[0]
+        return outputs
+
+    def execute(self, commands):
+        """
+        Runs a single line command, or a list of them in a row, and returns
+        its output (or the list of outputs). Raises `IOError` if vtysh
+        doesn't answer in `timeout` seconds or exits.
+
+        Commands in a list share the vtysh node, so configuration commands
+        can be batched after 'configure terminal'.
+        """
+        single = not isinstance(commands, list)
+        if single:
+            commands = [commands]
+
+        with self.lock:
+            try:
+                daemons = self.running_daemons()
+                if not self.is_open() or daemons != self.daemons:
+                    self.open()
+                    self.daemons = daemons
+                outputs = self._execute(commands)
+                # Don't leak configuration nodes to the next command
+                if self.config_node:
+                    self._execute(['end'])
+            except (IOError, OSError):
+                self.close()
+                raise
+
+        if single:
+            return outputs[0]
+        return outputs
+
+def split_vtysh_echo(output, commands):
+    """
+    Splits the output of `vtysh -E -c ... -c ...`, where every command is
+    echoed after the prompt, in the output of each command. vtysh exits
+    after the first failing command: returns a list with the output of the
+    commands found in `output` and whether the last of them was run in a
+    configuration node.
+    """
+    output = output.replace('\r', '')
+    hostname = None
+    config = False
+    bounds = []
+    for command in commands:
+        # Output not ending in a new line is followed by the next echo
+        echo = re.compile('{}{}\n'.format(VtyshSession.prompt(hostname),
+                                          re.escape(command)))
+        match = echo.search(output, bounds[-1][1] if bounds else 0)
+        if match is None:
+            break
+        hostname = match.group(1)
+        config = match.group(2) is not None
+        bounds.append((match.start(), match.end()))
+
+    ends = [start for start, _ in bounds[1:]] + [len(output)]
+    return ([output[end:stop] for (_, end), stop in zip(bounds, ends)],
+            config)
+
 
 class Router(Node):
     "A Node with IPv4/IPv6 forwarding enabled and Quagga as Routing Engine"
@@ -601,7 +1552,7 @@ class Router(Node):
         # specified, then attempt to generate an unique logdir.
         if self.logdir is None:
             cur_test = os.environ['PYTEST_CURRENT_TEST']
-            self.logdir = ('/tmp/topotests/' +
+            self.logdir = (worker_logdir() + '/' +
                            cur_test[0:cur_test.find(".py")].replace('/', '.'))
 
         # If the logdir is not created, then create it and set the
@@ -620,6 +1571,9 @@ class Router(Node):
         self.daemons_options = {'zebra': ''}
         self.reportCores = True
         self.version = None
+        # Deadlines (in seconds) for daemons to become ready / to exit
+        self.daemonStartTimeout = 30
+        self.daemonStopTimeout = 10
 
     def _config_frr(self, **params):
         "Configure FRR binaries"
@@ -680,6 +1634,7 @@ class Router(Node):
         super(Router, self).terminate()
         os.system('chmod -R go+rw /tmp/topotests')
 
+    @timed_method('stop')
     def stopRouter(self, wait=True, assertOnError=True, minErrorVersion='5.1'):
         # Stop Running Quagga or FRR Daemons
         rundaemons = self.cmd('ls -1 /var/run/%s/*.pid' % self.routertype)
@@ -688,6 +1643,7 @@ class Router(Node):
             return errors
         if rundaemons is not None:
             numRunning = 0
+            pids = []
             for d in StringIO.StringIO(rundaemons):
                 daemonpid = self.cmd('cat %s' % d.rstrip()).rstrip()
                 if (daemonpid.isdigit() and pid_exists(int(daemonpid))):
@@ -699,8 +1655,13 @@ class Router(Node):
                     self.waitOutput()
                     if pid_exists(int(daemonpid)):
                         numRunning += 1
+                        pids.append(int(daemonpid))
             if wait and numRunning > 0:
-                sleep(2, '{}: waiting for daemons stopping'.format(self.name))
+                logger.info('{}: waiting for daemons stopping'.format(self.name))
+                running = pids_wait_exit(pids, self.daemonStopTimeout)
+                if running:
+                    logger.info('{}: daemons still running after {} seconds'.format(
+                        self.name, self.daemonStopTimeout))
                 # 2nd round of kill if daemons didn't exit
                 for d in StringIO.StringIO(rundaemons):
                     daemonpid = self.cmd('cat %s' % d.rstrip()).rstrip()
@@ -721,6 +1682,19 @@ class Router(Node):
                     assert "Errors found - details follow:" == 0, errors
         return errors
 
+    def reset(self, logdir):
+        """
+        Forgets the daemons loaded with loadConf() and their configuration
+        files, so the router node can be reused by another test with its
+        logs in `logdir`.
+        """
+        self.logdir = logdir
+        for daemon in self.daemons:
+            self.daemons[daemon] = 0
+        self.daemons_options = {'zebra': ''}
+        self.reportCores = True
+        self.cmd('rm -f /etc/{}/*.conf'.format(self.routertype))
+
     def removeIPs(self):
         for interface in self.intfNames():
             self.cmd('ip address flush', interface)
@@ -817,6 +1791,7 @@ class Router(Node):
         self.restartRouter()
         return ""
 
+    @timed_method('restart')
     def restartRouter(self):
         # Starts actual daemons without init (ie restart)
         # cd to per node directory
@@ -827,6 +1802,11 @@ class Router(Node):
         if self.version == None:
             self.version = self.cmd(os.path.join(self.daemondir, 'bgpd')+' -v').split()[2]
             logger.info('{}: running version: {}'.format(self.name,self.version))
+        # Remove stale pid files (of daemons no longer running), readiness
+        # checks must only see the daemons started below
+        self.cmd('for f in /var/run/{}/*.pid; do '
+                 'kill -0 `cat $f` 2>/dev/null || rm -f $f; done'.format(
+                     self.routertype))
         # Start Zebra first
         if self.daemons['zebra'] == 1:
             zebra_path = os.path.join(self.daemondir, 'zebra')
@@ -836,7 +1816,8 @@ class Router(Node):
             ))
             self.waitOutput()
             logger.debug('{}: {} zebra started'.format(self, self.routertype))
-            sleep(1, '{}: waiting for zebra to start'.format(self.name))
+            # Other daemons connect to zebra, make sure it is listening
+            self.waitDaemonsReady(['zebra'])
         # Start staticd next if required
         if self.daemons['staticd'] == 1:
             staticd_path = os.path.join(self.daemondir, 'staticd')
@@ -860,6 +1841,74 @@ class Router(Node):
             ))
             self.waitOutput()
             logger.debug('{}: {} {} started'.format(self, self.routertype, daemon))
+        # Wait for everything else to come up (they all start in parallel)
+        self.waitDaemonsReady([daemon for daemon in self.daemons
+                               if self.daemons[daemon] == 1 and
+                               daemon != 'zebra'])
+
+    def checkDaemonReady(self, daemon):
+        """
+        Returns the startup state of `daemon`:
+        * 'ready': it wrote its pid file, listens on its vty socket and
+          answers a vtysh probe
+        * 'dead': its pid file points to a process that already exited
+        * 'starting': none of the above (yet)
+        """
+        rundir = '/var/run/{}'.format(self.routertype)
+        output = self.cmd(
+            'cat {0}/{1}.pid 2>/dev/null; test -S {0}/{1}.vty && echo vty'.format(
+                rundir, daemon)).split()
+        if not output or not output[0].isdigit():
+            return 'starting'
+        if not pid_exists(int(output[0])):
+            return 'dead'
+        if 'vty' not in output:
+            return 'starting'
+
+        probe = self.cmd(
+            'vtysh -d {} -c "show version" >/dev/null 2>&1 && echo ready'.format(
+                daemon))
+        if 'ready' not in probe:
+            return 'starting'
+        return 'ready'
+
+    def waitDaemonsReady(self, daemons, timeout=None, interval=0.1):
+        """
+        Polls `daemons` with checkDaemonReady() until all of them are ready or
+        the deadline (`daemonStartTimeout` unless `timeout` is set) expires.
+
+        Returns the list of daemons that did not become ready. Daemons that
+        die during startup are not waited for, checkRouterRunning() reports
+        them later.
+        """
+        if timeout is None:
+            timeout = self.daemonStartTimeout
+        start_time = time.time()
+        deadline = start_time + timeout
+        pending = list(daemons)
+        failed = []
+        while pending:
+            states = [(daemon, self.checkDaemonReady(daemon))
+                      for daemon in pending]
+            failed += [daemon for daemon, state in states if state == 'dead']
+            pending = [daemon for daemon, state in states
+                       if state == 'starting']
+            if not pending or time.time() >= deadline:
+                break
+            time.sleep(interval)
+
+        elapsed = time.time() - start_time
+        if failed:
+            logger.warning('{}: {} exited during startup'.format(
+                self.name, ', '.join(failed)))
+        if pending:
+            logger.warning('{}: {} not ready after {:.2f} seconds'.format(
+                self.name, ', '.join(pending), elapsed))
+        else:
+            logger.debug('{}: daemons ready after {:.2f} seconds'.format(
+                self.name, elapsed))
+        return pending + failed
+
     def getStdErr(self, daemon):
         return self.getLog('err', daemon)
     def getStdOut(self, daemon):
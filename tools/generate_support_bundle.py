@@ -2,8 +2,21 @@
 ### Python Script to generate the FRR support bundle ###
 ########################################################
 import os
+import re
+import time
+import gzip
+import zlib
+import json
+import difflib
+import hashlib
+import tarfile
+import select
+import tempfile
+import argparse
 import subprocess
 import datetime
+from StringIO import StringIO
+from multiprocessing.pool import ThreadPool
 
 TOOLS_DIR="tools/"
 ETC_DIR="/etc/frr/"
@@ -11,7 +24,49 @@ LOG_DIR="/var/log/frr/"
 SUCCESS = 1
 FAIL = 0
 
+# Number of commands run concurrently, per-command timeout and
+# time budget for the whole bundle (seconds)
+DEFAULT_JOBS = 4
+DEFAULT_TIMEOUT = 60
+DEFAULT_BUDGET = 300
+
+# Command result status
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_TIMEOUT = "timeout"
+STATUS_SKIPPED = "skipped"
+
+# Command outputs are read and compressed in chunks of this size; up to
+# SPOOL_SIZE bytes of compressed output per command are kept in memory
+# before spilling to a temporary file until it can be added to the archive
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024
+
+# Sampling mode: interval between samples (seconds) and the size of the
+# on-disk ring buffer, which is split into RING_SEGMENTS files so the
+# oldest samples can be dropped a segment at a time
+DEFAULT_INTERVAL = 60
+DEFAULT_RING_SIZE = 16 * 1024 * 1024
+RING_SEGMENTS = 8
+
+# Delta bundles: outputs up to this size are stored as a diff against the
+# previous bundle's output when that is smaller than half of the output
+DIFF_MAX_SIZE = 1024 * 1024
+
+# JSON outputs up to this size are parsed to record their key counts in
+# the index, larger ones are only checked while streaming through them;
+# per-key counts are only listed for up to JSON_MAX_KEYS keys
+JSON_PARSE_MAX = SPOOL_SIZE
+JSON_MAX_KEYS = 64
+
 inputFile = ETC_DIR + "support_bundle_commands.conf"
+bundleFile = LOG_DIR + "frr_support_bundle.tar"
+ringDir = LOG_DIR + "support_bundle_samples/"
+# Directory of the temporary files: the one the bundle (or the samples)
+# is written to, set from the command line
+spoolDir = LOG_DIR
+indexName = "index.json"
+samplesProc = "samples"
 
 # Open support bundle configuration file
 def openConfFile(i_file):
@@ -22,89 +77,568 @@ def openConfFile(i_file):
   except IOError:
     return ([])
 
-# Create the output file name
-def createOutputFile(procName):
-  fileName = procName + "_support_bundle.log"
-  oldFile = LOG_DIR + fileName
-  cpFileCmd = "cp " + oldFile + " " + oldFile + ".prev"
-  rmFileCmd = "rm -rf " + oldFile
-  print "Making backup of " + oldFile
-  os.system(cpFileCmd)
-  print "Removing " + oldFile
-  os.system(rmFileCmd)
-  return fileName
-
-# Open the output file for this process
-def openOutputFile(fileName):
-  crt_file_cmd = LOG_DIR + fileName
-  print crt_file_cmd
+# Open the archive for a new bundle.  It is written under a temporary
+# name and only replaces the previous bundle once it is complete.
+def openBundle(fileName):
   try:
-    outputFile = open(crt_file_cmd, "w")
-    return outputFile
-  except IOError:
-    return ()
+    return tarfile.open(fileName + ".tmp", "w", format=tarfile.PAX_FORMAT)
+  except (IOError, OSError, tarfile.TarError):
+    return None
+
+# Delta bundles are kept as <bundle>.<id>, <bundle> is a symlink to the
+# latest one.  Index entries in later bundles refer to them by id.
+def bundlePath(fileName, bundleId):
+  return fileName + "." + bundleId
+
+# Id of a new delta bundle: its creation time, with a counter appended if
+# a bundle with that id exists already
+def newBundleId(fileName):
+  stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S.%f")
+  bundleId = stamp
+  count = 1
+  while os.path.lexists(bundlePath(fileName, bundleId)):
+    bundleId = "%s-%d" % (stamp, count)
+    count += 1
+  return bundleId
+
+# Read the index manifest of an existing bundle
+def loadIndex(fileName):
+  try:
+    bundle = tarfile.open(fileName, "r")
+    try:
+      return json.load(bundle.extractfile(indexName))
+    finally:
+      bundle.close()
+  except (IOError, OSError, KeyError, ValueError, tarfile.TarError):
+    return None
+
+# Read and decompress one member's output from a bundle
+def readMember(fileName, location):
+  with open(fileName, "rb") as bundle:
+    bundle.seek(location["offset"])
+    data = bundle.read(location["size"])
+  return gzip.GzipFile(fileobj=StringIO(data)).read()
+
+# Where an index entry's output is actually stored: a member in the
+# given bundle, or whatever an unchanged output refers to.  Diffs carry
+# the location of the full output they apply to as "base".
+def entryLocation(entry, bundleId):
+  if "ref" in entry:
+    return entry["ref"]
+  location = {
+    "bundle": bundleId,
+    "member": entry["member"],
+    "offset": entry["offset"],
+    "size": entry["size"],
+  }
+  if "base" in entry:
+    location["base"] = entry["base"]
+  return location
+
+# Load what is needed to store a bundle as delta against the latest
+# delta bundle, or None if there is none
+def openDelta(fileName, diff):
+  if not os.path.islink(fileName):
+    return None
+  index = loadIndex(fileName)
+  if not index or "id" not in index:
+    return None
+
+  entries = {}
+  for entry in index["members"]:
+    if "sha256" in entry:
+      entries[(entry["proc"], entry["cmd"])] = entry
+  return {
+    "id": index["id"],
+    "entries": entries,
+    "diff": diff,
+  }
+
+# Store output as a diff against a full output stored in an earlier
+# bundle, if worthwhile
+def diffResult(fileName, result, location):
+  if result["rawsize"] > DIFF_MAX_SIZE:
+    return None
+  try:
+    base = readMember(bundlePath(fileName, location["bundle"]), location)
+  except (IOError, OSError):
+    return None
+  result["data"].seek(0)
+  text = gzip.GzipFile(fileobj=result["data"], mode="rb").read()
+  diff = "".join(difflib.unified_diff(base.splitlines(True),
+                                      text.splitlines(True)))
+  if len(diff) * 2 >= len(text):
+    return None
 
-# Close the output file for this process
-def closeOutputFile(file):
+  data = tempfile.SpooledTemporaryFile(SPOOL_SIZE, dir=spoolDir)
+  diffFile = gzip.GzipFile(fileobj=data, mode="wb")
+  diffFile.write(diff)
+  diffFile.close()
+  return data
+
+# Add the index manifest, close the archive and rotate the previous one
+def closeBundle(bundle, index, fileName, bundleId=None):
   try:
-    file.close()
+    commands = {}
+    for pos, entry in enumerate(index):
+      commands.setdefault(entry["cmd"], []).append(pos)
+    manifest = {"version": 1, "members": index, "commands": commands}
+    if bundleId:
+      manifest["id"] = bundleId
+    data = json.dumps(manifest, indent=1)
+    info = tarfile.TarInfo(indexName)
+    info.size = len(data)
+    info.mtime = time.time()
+    spool = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+    spool.write(data)
+    spool.seek(0)
+    bundle.addfile(info, spool)
+    bundle.close()
+    if os.path.exists(fileName) and not os.path.islink(fileName):
+      print "Making backup of " + fileName
+      os.rename(fileName, fileName + ".prev")
+    if bundleId:
+      os.rename(fileName + ".tmp", bundlePath(fileName, bundleId))
+      if os.path.lexists(fileName + ".tmp"):
+        os.unlink(fileName + ".tmp")
+      os.symlink(os.path.basename(bundlePath(fileName, bundleId)),
+                 fileName + ".tmp")
+    os.rename(fileName + ".tmp", fileName)
     return SUCCESS
-  except IOError:
+  except (IOError, OSError, tarfile.TarError):
     return FAIL
 
-# Execute the command over vtysh and store in the
-# output file
-def executeCommand(cmd, outputFile):
-  cmd_exec_str = "vtysh -c \"" + cmd + "\" "
+# Archive member name for a command's output
+def memberName(procName, seq, cmd, ext="txt"):
+  return "%s/%03d_%s.%s.gz" % (procName, seq,
+                               re.sub(r"[^A-Za-z0-9.-]+", "_", cmd), ext)
+
+# Check whether a command produced JSON output and summarize its keys
+# for the index.  Returns False if it didn't produce JSON.  Large outputs
+# are not parsed: they only need to start and end like a JSON object or
+# array, which is checked a chunk at a time.
+def checkJson(result):
+  if result["status"] != STATUS_OK:
+    return False
+  if result["rawsize"] > JSON_PARSE_MAX:
+    result["data"].seek(0)
+    jsonFile = gzip.GzipFile(fileobj=result["data"], mode="rb")
+    first = last = ""
+    while True:
+      chunk = jsonFile.read(CHUNK_SIZE)
+      if not chunk:
+        break
+      chunk = chunk.strip()
+      if chunk:
+        first = first or chunk[0]
+        last = chunk[-1]
+    return (first, last) in [("{", "}"), ("[", "]")]
+
+  result["data"].seek(0)
   try:
-    cmd_output = subprocess.check_output(cmd_exec_str, shell=True)
-    try:
-      dateTime = datetime.datetime.now()
-      outputFile.write(">>[" + str(dateTime) + "]" + cmd + "\n")
-      outputFile.write(cmd_output)
-      outputFile.write("########################################################\n")
-      outputFile.write('\n')
-    except:
-      print "Writing to ouptut file Failed"
-  except subprocess.CalledProcessError as e:
-    dateTime = datetime.datetime.now()
-    outputFile.write(">>[" + str(dateTime) + "]" + cmd + "\n")
-    outputFile.write(e.output)
-    outputFile.write("########################################################\n")
-    outputFile.write('\n')
-    print "Error:" + e.output
-
-
-# Process the support bundle configuration file
-# and call appropriate functions
+    data = json.load(gzip.GzipFile(fileobj=result["data"], mode="rb"))
+  except ValueError:
+    return False
+  if not isinstance(data, (dict, list)):
+    return False
+  result["keys"] = len(data)
+  if isinstance(data, dict) and len(data) <= JSON_MAX_KEYS:
+    result["keycounts"] = dict([(k, len(v) if isinstance(v, (dict, list)) else 1)
+                                for k, v in data.items()])
+  return True
+
+# Add a command's compressed output to the archive and record it
+# in the index.  Data offsets allow extracting a single output
+# without reading through the rest of the archive.
+#
+# For delta bundles, output that is unchanged from the previous bundle
+# is only recorded as a reference to where it is stored, and changed
+# output optionally as a diff.
+def addResult(bundle, index, procName, seq, result, delta=None, fileName=None):
+  entry = {
+    "proc": procName,
+    "cmd": result["cmd"],
+    "rawsize": result["rawsize"],
+    "sha256": result["sha256"].hexdigest(),
+    "format": result.get("format", "text"),
+    "start": str(result["start"]),
+    "duration": round(result["duration"], 3),
+    "status": result["status"],
+  }
+
+  data = result["data"]
+  name = memberName(procName, seq, result["cmd"],
+                    "txt" if entry["format"] == "text" else entry["format"])
+  for key in ["keys", "keycounts"]:
+    if key in result:
+      entry[key] = result[key]
+  prev = delta and delta["entries"].get((procName, result["cmd"]))
+  if prev:
+    location = entryLocation(prev, delta["id"])
+    if prev["sha256"] == entry["sha256"]:
+      data.close()
+      entry["ref"] = location
+      index.append(entry)
+      return SUCCESS
+    if delta["diff"]:
+      # diffs always apply to a full output, never to another diff
+      location = location.get("base", location)
+      diff = diffResult(fileName, result, location)
+      if diff:
+        data.close()
+        data = diff
+        name = name.rsplit(".", 2)[0] + ".diff.gz"
+        entry["base"] = location
+
+  info = tarfile.TarInfo(name)
+  data.seek(0, os.SEEK_END)
+  info.size = data.tell()
+  info.mtime = time.mktime(result["start"].timetuple())
+  data.seek(0)
+  try:
+    bundle.addfile(info, data)
+  except (IOError, OSError, tarfile.TarError):
+    print "Writing to ouptut file Failed"
+    return FAIL
+  finally:
+    data.close()
+
+  entry["member"] = info.name
+  entry["offset"] = bundle.offset - ((info.size + tarfile.BLOCKSIZE - 1) //
+                                     tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+  entry["size"] = info.size
+  index.append(entry)
+  return SUCCESS
+
+# Kill a command that ran into its timeout
+def killCommand(proc, result):
+  result["status"] = STATUS_TIMEOUT
+  try:
+    proc.kill()
+  except OSError:
+    pass
+
+# Set up the result of a command; output is compressed into "data"
+def newResult(cmd, start):
+  result = {
+    "cmd": cmd,
+    "start": start,
+    "duration": 0.0,
+    "status": STATUS_OK,
+    "data": tempfile.SpooledTemporaryFile(SPOOL_SIZE, dir=spoolDir),
+    "rawsize": 0,
+    "sha256": hashlib.sha256(),
+  }
+  result["gzip"] = gzip.GzipFile(fileobj=result["data"], mode="wb")
+  return result
+
+# Append text to a command's compressed output
+def writeOutput(result, text):
+  result["gzip"].write(text)
+  result["rawsize"] += len(text)
+  result["sha256"].update(text)
+
+# Execute the command over vtysh, bounded by the per-command timeout
+# and the overall deadline.  The output is compressed as it is read.
+# Returns a dict describing the result.
+def executeCommand(cmd, timeout, deadline):
+  result = newResult(cmd, datetime.datetime.now())
+  try:
+    runCommand(cmd, timeout, deadline, result)
+  finally:
+    result.pop("gzip").close()
+  return result
+
+def runCommand(cmd, timeout, deadline, result):
+  remaining = deadline - time.time()
+  if remaining <= 0:
+    result["status"] = STATUS_SKIPPED
+    writeOutput(result, "Skipped: support bundle time budget exhausted\n")
+    return
+  timeout = min(timeout, remaining)
+
+  startTime = time.time()
+  try:
+    # no preexec_fn: it isn't safe to use from the worker threads.
+    # close_fds keeps the pipes of concurrent commands from leaking into
+    # each other, which would hold them open after a kill.
+    proc = subprocess.Popen(["vtysh", "-c", cmd], stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, close_fds=True)
+  except OSError as e:
+    result["status"] = STATUS_ERROR
+    writeOutput(result, "Error: " + str(e) + "\n")
+    return
+
+  # the output is read with a deadline instead of killing the command from
+  # a timer: anything it spawned may keep the pipe open after the kill
+  endTime = startTime + timeout
+  try:
+    while True:
+      remaining = endTime - time.time()
+      if remaining <= 0 or not select.select([proc.stdout], [], [], remaining)[0]:
+        killCommand(proc, result)
+        break
+      chunk = os.read(proc.stdout.fileno(), CHUNK_SIZE)
+      if not chunk:
+        break
+      writeOutput(result, chunk)
+    proc.wait()
+  finally:
+    proc.stdout.close()
+  result["duration"] = time.time() - startTime
+
+  if result["status"] == STATUS_TIMEOUT:
+    writeOutput(result, "\nTimed out after %.1f seconds\n" % timeout)
+  elif proc.returncode != 0:
+    result["status"] = STATUS_ERROR
+    print "Error:", cmd
+
+# Process the support bundle configuration file into a list of
+# (process name, [commands]) tuples and the list of sampled commands
 def processConfFile(lines):
+  procs = []
+  samples = []
+  cmds = None
   for line in lines:
-    if line[0][0] == '#':
+    if line[0] == '#':
       continue
-    cmd_line = line.split(':')
+    cmd_line = line.split(':', 1)
     if cmd_line[0] == "PROC_NAME":
-      outputFileName = createOutputFile(cmd_line[1])
-      if outputFileName:
-        print outputFileName, "created for", cmd_line[1]
-    elif cmd_line[0] == "CMD_LIST_START":
-      outputFile = openOutputFile(outputFileName)
-      if outputFile:
-        print outputFileName, "opened"
-      else:
-        print outputFileName, "open failed"
-	return FAIL
-    elif cmd_line[0] == "CMD_LIST_END":
-      if closeOutputFile(outputFile):
-        print outputFileName, "closed"
-      else:
-        print outputFileName, "close failed"
-    else:
-      print "Execute:" , cmd_line[0]
-      executeCommand(cmd_line[0], outputFile)
-      
+      procs.append((cmd_line[1], []))
+    elif cmd_line[0] == "CMD_LIST_START" and procs:
+      cmds = procs[-1][1]
+    elif cmd_line[0] == "SAMPLE_LIST_START":
+      cmds = samples
+    elif cmd_line[0] in ["CMD_LIST_END", "SAMPLE_LIST_END"]:
+      cmds = None
+    elif cmds is not None:
+      cmds.append(line.strip())
+  return procs, samples
+
+# List the ring buffer segments, oldest first
+def listSegments(ringDir):
+  try:
+    names = [n for n in os.listdir(ringDir) if n.endswith(".samples")]
+  except OSError:
+    return []
+  names.sort(key=lambda n: int(n.split(".")[0]))
+  return [os.path.join(ringDir, n) for n in names]
+
+# Append a sample to the ring buffer.  Each record is a JSON header line
+# followed by the gzip-compressed output.  Once the ring buffer exceeds
+# its size, the oldest segments are removed.
+def appendSample(ringDir, ringSize, result):
+  segments = listSegments(ringDir)
+  if not segments or os.path.getsize(segments[-1]) >= ringSize // RING_SEGMENTS:
+    # segments are named by creation time, and must sort after the last one
+    segId = int(time.time())
+    if segments:
+      segId = max(segId, int(os.path.basename(segments[-1]).split(".")[0]) + 1)
+    segments.append(os.path.join(ringDir, "%d.samples" % segId))
+
+  data = result["data"]
+  data.seek(0, os.SEEK_END)
+  header = {
+    "time": time.mktime(result["start"].timetuple()) +
+            result["start"].microsecond / 1e6,
+    "cmd": result["cmd"],
+    "status": result["status"],
+    "duration": round(result["duration"], 3),
+    "size": data.tell(),
+  }
+  data.seek(0)
+  try:
+    with open(segments[-1], "ab") as segment:
+      segment.write(json.dumps(header) + "\n")
+      while True:
+        chunk = data.read(CHUNK_SIZE)
+        if not chunk:
+          break
+        segment.write(chunk)
+  except IOError:
+    print "Writing to sample file Failed"
+  finally:
+    data.close()
+
+  total = sum([os.path.getsize(n) for n in segments])
+  while total > ringSize and len(segments) > 1:
+    total -= os.path.getsize(segments[0])
+    os.unlink(segments.pop(0))
+
+# Read (header, compressed output) records from the ring buffer
+# that were taken at or after the given time.  A segment is read up to
+# the first incomplete record, e.g. one a running --sample is appending.
+def readSamples(ringDir, since):
+  for fileName in listSegments(ringDir):
+    try:
+      with open(fileName, "rb") as segment:
+        while True:
+          line = segment.readline()
+          if not line.endswith("\n"):
+            break
+          header = json.loads(line)
+          data = segment.read(header["size"])
+          if len(data) != header["size"]:
+            break
+          if header["time"] >= since:
+            yield header, data
+    except (IOError, ValueError, KeyError):
+      print "Reading sample file", fileName, "Failed"
+
+# Periodically run the sampled commands and store the results in the
+# ring buffer.  Commands are run one at a time to keep the overhead low;
+# each round must finish within the sampling interval.
+def sampleLoop(samples, interval, timeout, ringDir, ringSize):
+  if not os.path.isdir(ringDir):
+    os.makedirs(ringDir)
+  while True:
+    tick = time.time()
+    for cmd in samples:
+      appendSample(ringDir, ringSize,
+                   executeCommand(cmd, timeout, tick + interval))
+    time.sleep(max(0, tick + interval - time.time()))
+
+# Add the samples from the last minutes to the bundle, one member per
+# command with all of its samples as a time series
+def addSamples(bundle, index, ringDir, minutes):
+  results = {}
+  for header, data in readSamples(ringDir, time.time() - minutes * 60):
+    try:
+      output = gzip.GzipFile(fileobj=StringIO(data)).read()
+    except (IOError, EOFError, zlib.error):
+      print "Skipping corrupt sample of", header["cmd"]
+      continue
+
+    result = results.get(header["cmd"])
+    if result is None:
+      result = newResult(header["cmd"],
+                         datetime.datetime.fromtimestamp(header["time"]))
+      results[header["cmd"]] = result
+
+    sampleTime = datetime.datetime.fromtimestamp(header["time"])
+    writeOutput(result, ">>[%s]%s\n" % (sampleTime, header["cmd"]))
+    writeOutput(result, output)
+    writeOutput(result, "<<[status: %s, duration: %.3fs]\n" %
+                (header["status"], header["duration"]))
+    result["duration"] += header["duration"]
+    if header["status"] != STATUS_OK:
+      result["status"] = header["status"]
+
+  for seq, cmd in enumerate(sorted(results.keys())):
+    result = results[cmd]
+    result.pop("gzip").close()
+    addResult(bundle, index, samplesProc, seq + 1, result)
+
+# Run all commands on a pool of workers and add the results
+# to the bundle archive, in configuration file order
+def collectSupportBundle(procs, jobs, timeout, budget, fileName, ringDir,
+                         minutes, delta, diff, captureJson):
+  deadline = time.time() + budget
+  bundleId = None
+  deltaBase = None
+  if delta:
+    bundleId = newBundleId(fileName)
+    deltaBase = openDelta(fileName, diff)
+    if deltaBase:
+      print "Storing changes against bundle", deltaBase["id"]
+  # with captureJson, try the JSON variant of each command too; it is
+  # stored next to the text output if the command supports it
+  tasks = []
+  for procName, cmds in procs:
+    for cmd in cmds:
+      if cmd.endswith(" json"):
+        tasks.append((procName, cmd, "json", False))
+        continue
+      tasks.append((procName, cmd, "text", False))
+      if captureJson:
+        tasks.append((procName, cmd + " json", "json", True))
+
+  def runTask(task):
+    print "Execute:", task[1]
+    result = executeCommand(task[1], timeout, deadline)
+    result["format"] = task[2]
+    return task[0], task[3], result
+
+  bundle = openBundle(fileName)
+  if not bundle:
+    print fileName, "open failed"
+    return FAIL
+  print fileName, "opened"
+
+  index = []
+  seq = {}
+  pool = ThreadPool(max(1, jobs))
+  try:
+    for procName, variant, result in pool.imap(runTask, tasks):
+      # JSON variants share the sequence number of the text output
+      if not variant:
+        seq[procName] = seq.get(procName, 0) + 1
+      if result["format"] == "json" and not checkJson(result):
+        result["data"].close()
+        continue
+      addResult(bundle, index, procName, seq[procName], result, deltaBase,
+                fileName)
+  finally:
+    pool.close()
+    pool.join()
+
+  if minutes > 0:
+    addSamples(bundle, index, ringDir, minutes)
+
+  if closeBundle(bundle, index, fileName, bundleId):
+    print fileName, "closed"
+    return SUCCESS
+  print fileName, "close failed"
+  return FAIL
+
 # Main Function
-lines = openConfFile(inputFile)
+parser = argparse.ArgumentParser(description="Generate the FRR support bundle")
+parser.add_argument("-c", "--config", default=inputFile,
+                    help="command list (default: %(default)s)")
+parser.add_argument("-o", "--output", default=bundleFile,
+                    help="bundle archive (default: %(default)s)")
+parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                    help="number of commands to run concurrently")
+parser.add_argument("-t", "--timeout", type=float, default=DEFAULT_TIMEOUT,
+                    help="timeout for each command, in seconds")
+parser.add_argument("-b", "--budget", type=float, default=DEFAULT_BUDGET,
+                    help="time budget for the whole bundle, in seconds")
+parser.add_argument("--sample", action="store_true",
+                    help="continuously sample the SAMPLE_LIST commands "
+                         "into the ring buffer instead of creating a bundle")
+parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                    help="sampling interval, in seconds")
+parser.add_argument("--ring-dir", default=ringDir,
+                    help="sample ring buffer directory (default: %(default)s)")
+parser.add_argument("--ring-size", type=int, default=DEFAULT_RING_SIZE,
+                    help="sample ring buffer size, in bytes")
+parser.add_argument("-d", "--delta", action="store_true",
+                    help="keep bundles as <output>.<id> and only store "
+                         "output that changed since the previous one")
+parser.add_argument("--diff", action="store_true",
+                    help="with --delta, store changed output as a diff "
+                         "when that is smaller")
+parser.add_argument("--json", action="store_true",
+                    help="also try to capture the JSON variant of each "
+                         "command (runs every command twice)")
+parser.add_argument("-m", "--minutes", type=float, default=0,
+                    help="add the samples of the last MINUTES to the bundle")
+args = parser.parse_args()
+
+lines = openConfFile(args.config)
 if not lines:
   print "File support_bundle_commands.conf not present in /etc/frr/ directory"
 else:
-  processConfFile(lines)
+  procs, samples = processConfFile(lines)
+  if args.sample:
+    spoolDir = args.ring_dir
+    if not samples:
+      print "No SAMPLE_LIST commands configured"
+    else:
+      sampleLoop(samples, args.interval, min(args.timeout, args.interval),
+                 args.ring_dir, args.ring_size)
+  else:
+    spoolDir = os.path.dirname(os.path.abspath(args.output))
+    collectSupportBundle(procs, args.jobs, args.timeout, args.budget,
+                         args.output, args.ring_dir, args.minutes,
+                         args.delta or args.diff, args.diff, args.json)
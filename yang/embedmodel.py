@@ -5,6 +5,11 @@
 
 import sys, string, re
 
+compress = False
+if len(sys.argv) > 1 and sys.argv[1] == '-z':
+    compress = True
+    sys.argv.pop(1)
+
 inname = sys.argv[1]
 outname = sys.argv[2]
 
@@ -21,14 +26,11 @@ template = '''/* autogenerated by embedmodel.py.  DO NOT EDIT */
 #include <zebra.h>
 #include "yang.h"
 
-static const char model[] =
-\t"%s";
-
+%s
 static struct yang_module_embed embed = {
 \t.mod_name = "%s",
 \t.mod_rev = "%s",
-\t.data = model,
-\t.format = %s,
+%s\t.format = %s,
 };
 
 static void embed_register(void) __attribute__((_CONSTRUCTOR(2000)));
@@ -38,6 +40,23 @@ static void embed_register(void)
 }
 '''
 
+template_plain = '''static const char model[] =
+\t"%s";
+'''
+data_plain = '''\t.data = model,
+'''
+
+# zlib-compressed variant; the module is only inflated in yang.c when
+# libyang asks for it.  data_len includes the terminating NUL.
+template_z = '''static const unsigned char model_z[] = {
+%s
+};
+'''
+data_z = '''\t.data_z = model_z,
+\t.data_z_len = sizeof(model_z),
+\t.data_len = %d,
+'''
+
 passchars = set(string.printable) - set('\\\'"%\r\n\t\x0b\x0c')
 def escapech(char):
     if char in passchars:
@@ -59,9 +78,10 @@ with open(inname, 'r') as fd:
 # arises.  It does avoid the regex'ing.
 if '<?xml' in data:
     from xml.etree import ElementTree
+    yin = '{urn:ietf:params:xml:ns:yang:yin:1}'
     xml = ElementTree.fromstring(data)
     name = xml.get('name')
-    rev = xml.find('{urn:ietf:params:xml:ns:yang:yin:1}revision').get('date')
+    rev = xml.find(yin + 'revision').get('date')
     fmt = 'LYS_YIN'
 else:
     name = re_name.search(data).group(1)
@@ -71,8 +91,22 @@ else:
 if name is None or rev is None:
     raise ValueError('cannot determine YANG module name and revision')
 
-lines = [escape(row) for row in data.split('\n')]
-text = '\\n"\n\t"'.join(lines)
+if compress:
+    import zlib
+
+    raw = data.encode('utf-8')
+    packed = bytearray(zlib.compress(raw, 9))
+    lines = []
+    for i in range(0, len(packed), 16):
+        lines.append('\t%s,' % (', '.join(['0x%02x' % b for b in packed[i:i + 16]])))
+    model = template_z % ('\n'.join(lines))
+    modeldata = data_z % (len(raw) + 1)
+else:
+    lines = [escape(row) for row in data.split('\n')]
+    text = '\\n"\n\t"'.join(lines)
+    model = template_plain % (text)
+    modeldata = data_plain
 
 with open(outname, 'w') as fd:
-    fd.write(template % (text, escape(name), escape(rev), fmt))
+    fd.write(template % (model, escape(name), escape(rev),
+                         modeldata, fmt))